@@ -2,9 +2,10 @@
 import sys
 sys.path.insert(0, '../../')
 import logging
-from caelum import eere
 import poplar.environment as env
-env.set_weather(eere.EPWdata('418830'))
+from poplar.weather import epw
+WEATHER = epw('418830')
+env.set_weather(WEATHER)
 logging.basicConfig(level=logging.WARNING)
 
 from poplar.devices import Gateway
@@ -12,6 +13,7 @@ from poplar.storage import IdealStorage
 from poplar.sources import SimplePV, Site, InclinedPlane
 from poplar.controllers import MPPTChargeController
 import poplar.loads as loads
+from poplar.engine import run
 PLACE = (24.811468, 89.334329)
 
 # Alternate sizings
@@ -28,9 +30,7 @@ case = Gateway([loads.Annual(),
                plant,
                batt])
 
-for i, r in enumerate(eere.EPWdata('418830')):
-    env.update_time(r['datetime'])
-    case()
+run(case, WEATHER.datetimes())
 
 if __name__ == '__main__':
     print case.details()
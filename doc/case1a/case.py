@@ -3,9 +3,10 @@
 import sys
 sys.path.insert(0, '../../')
 import logging
-from caelum import eere
 import poplar.environment as env
-env.set_weather(eere.EPWdata('418830'))
+from poplar.weather import epw
+WEATHER = epw('418830')
+env.set_weather(WEATHER)
 # logging.basicConfig(level=logging.INFO)
 logging.basicConfig(level=logging.WARNING)
 
@@ -14,6 +15,7 @@ from poplar.storage import IdealStorage
 from poplar.sources import SimplePV, Site, InclinedPlane
 from poplar.controllers import MPPTChargeController
 import poplar.loads as loads
+from poplar.engine import run
 PLACE = (24.811468, 89.334329)
 
 batt = IdealStorage(391.)
@@ -23,9 +25,7 @@ case = Gateway([loads.Annual(),
                plant,
                batt])
 
-for i, r in enumerate(eere.EPWdata('418830')):
-    env.update_time(r['datetime'])
-    case()
+run(case, WEATHER.datetimes())
 
 if __name__ == '__main__':
     from poplar.visuals import rst_domain, rst_batt, rst_graph
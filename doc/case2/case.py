@@ -2,9 +2,10 @@
 import sys
 sys.path.insert(0, '../../')
 import logging
-from caelum import eere
 import poplar.environment as env
-env.set_weather(eere.EPWdata('418830'))
+from poplar.weather import epw
+WEATHER = epw('418830')
+env.set_weather(WEATHER)
 logging.basicConfig(level=logging.WARNING)
 
 from poplar.devices import Gateway
@@ -31,7 +32,7 @@ case = Gateway([lights,
                plant,
                batt])
 
-for i, r in enumerate(eere.EPWdata('418830')):
+for i, r in enumerate(WEATHER):
     env.update_time(r['datetime'])
     case()
 
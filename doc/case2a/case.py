@@ -1,10 +1,11 @@
 """System with multiple reliablity domains."""
 import sys
 import logging
-from caelum import eere
 sys.path.insert(0, '../../')
 import poplar.environment as env
-env.set_weather(eere.EPWdata('418830'))
+from poplar.weather import epw
+WEATHER = epw('418830')
+env.set_weather(WEATHER)
 # logging.basicConfig(level=logging.INFO)
 logging.basicConfig(level=logging.WARNING)
 
@@ -62,7 +63,7 @@ for neighbor in case.network.neighbors(case):
 
 print nontrivial
 
-for i, r in enumerate(eere.EPWdata('418830')):
+for i, r in enumerate(WEATHER):
     env.update_time(r['datetime'])
     case()
 
@@ -2,8 +2,26 @@
 #
 # This program is free software. See terms in LICENSE file.
 """Charge Controller Class."""
+import numpy as np
 from misc import significant
 from sources import Source
+from ledger import Series
+
+
+def total_losses(losses, total=0.):
+    """Sum losses step by step and child by child.
+
+    Args:
+        losses (list): arrays of losses of each child.
+        total (float): losses before first step.
+
+    Returns:
+        (float)
+    """
+    if not losses:
+        return total
+    losses = np.column_stack(losses).ravel()
+    return float(np.cumsum(np.append(total, losses))[-1])
 
 
 class ChargeController(Source):
@@ -23,10 +41,10 @@ class ChargeController(Source):
         Args:
             array_like (list): list of DC sources.
         """
-        self.generation = {}
-        self.balance = {}
+        self.generation = Series()
+        self.balance = Series()
         self.children = array_like
-        self.debits = {}
+        self.debits = Series(0.)
         self.gen = True
         self.loss = 0.
         self.device_cost = 10.
@@ -60,6 +78,44 @@ class ChargeController(Source):
             w += v * i
         return w
 
+    def output_series(self, weather, start=None, hours=1.):
+        """Output of a run of steps.
+
+        Args:
+            weather (WeatherStore): weather of each step.
+            start (int): first step, None if steps are not simulated.
+            hours (float or ndarray): hours of each step.
+
+        Returns:
+            (ndarray): Wh of each step.
+        """
+        vi = [child.output_series(weather, start) for child in self.children]
+        w, losses = self.convert(vi)
+        self.add_losses([loss * hours for loss in losses])
+        return w * hours
+
+    def convert(self, vi):
+        """Output of module voltages and currents.
+
+        Args:
+            vi (list): (vmp, imp) arrays of each child.
+
+        Returns:
+            (ndarray, list): output and arrays of losses of each child.
+        """
+        w = 0.
+        for v, i in vi:
+            w = w + v * i
+        return w, []
+
+    def add_losses(self, losses):
+        """Add losses in order, as output adds losses step by step.
+
+        Args:
+            losses (list): arrays of losses of each child.
+        """
+        self.loss = total_losses(losses, self.loss)
+
     __call__ = output
 
     def __repr__(self):
@@ -114,9 +170,18 @@ class MPPTChargeController(ChargeController):
         for child in self.children:
             v, i = child()
             w += v * i
-            self.loss += (1. - self.efficiency) * v * i
+            self.loss += (1. - self.efficiency) * v * i * \
+                self.context.timestep
         return w * self.efficiency
 
+    def convert(self, vi):
+        w = 0.
+        losses = []
+        for v, i in vi:
+            w = w + v * i
+            losses.append((1. - self.efficiency) * v * i)
+        return w * self.efficiency, losses
+
     __call__ = output
 
     def __repr__(self):
@@ -167,10 +232,18 @@ class SimpleChargeController(ChargeController):
         w = 0.
         for child in self.children:
             v, i = child()
-            self.loss += (v - self.vnom) * i
+            self.loss += (v - self.vnom) * i * self.context.timestep
             w += self.vnom * i
         return w
 
+    def convert(self, vi):
+        w = 0.
+        losses = []
+        for v, i in vi:
+            losses.append((v - self.vnom) * i)
+            w = w + self.vnom * i
+        return w, losses
+
     __call__ = output
 
     def __repr__(self):
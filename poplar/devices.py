@@ -1,66 +1,254 @@
 import numpy as np
 import networkx as nx
 import environment as env
-from misc import significant, Counter
-from econ import low_offer, rank_bids
+from misc import significant
+from econ import BidBook, Auction
 from visuals import multi_report
 from merit import STEEPMerit
+from ledger import Ledger, whole
 
 import logging
 logger = logging.getLogger(__name__)
 
-SMALL_ID = Counter()
+LEDGERS = ('credits', 'debits', 'balance', 'demand', 'outage', 'source',
+           'hours')
+
+
+def rollup(method):
+    """Mark method as the sum of a parameter of children."""
+    method.rollup = True
+    return method
 
 
 class Model(object):
-    """Base object class."""
+    """Base object class.
+
+    Attributes:
+        handle (int): dense registry handle of device in its network.
+        inputs (tuple): attributes holding read only inputs, which snapshots
+            share rather than copy.
+    """
+
+    handle = None
+    inputs = ()
+
+    def _get_context(self):
+        return self.__dict__.get('_context') or env.current()
+
+    def _set_context(self, context):
+        self._context = context
+
+    context = property(_get_context, _set_context,
+                       doc='SimulationContext of device.')
+
+    def bind(self, context):
+        """Bind device and all devices in its network to a context.
+
+        Args:
+            context (SimulationContext)
+        """
+        for node in self.graph():
+            node.context = context
+
     def graph(self):
         """Device Graph of all decendants.
 
+        The tree below self is connected in a single traversal.  Networks
+        already built by descendants are not traversed again, the largest is
+        kept and smaller ones are merged into it, leaving every device
+        sharing one network.
+
         Returns:
             (Graph)
         """
+        network = self.__dict__.get('network')
+        networks = [] if network is None else [network]
+        nodes = [self]
+        edges = []
+        seen = set([id(self)])
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for child in getattr(node, 'children', None) or []:
+                edges.append((node, child))
+                if id(child) in seen:
+                    continue
+                seen.add(id(child))
+                other = child.__dict__.get('network')
+                if other is None or other is network:
+                    nodes.append(child)
+                    stack.append(child)
+                elif not any(other is n for n in networks):
+                    networks.append(other)
+        if networks:
+            network = max(networks, key=len)
+        else:
+            network = nx.Graph()
+        for other in networks:
+            if other is not network:
+                network.add_nodes_from(other)
+                network.add_edges_from(other.edges())
+                nodes.extend(other)
+        network.add_nodes_from(nodes)
+        network.add_edges_from(edges)
+        for node in nodes:
+            node.network = network
+        network.graph.pop('registry', None)  # routes are stale
+        network.graph.pop('nodes', None)
+        network.graph.pop('domains', None)
+        network.graph.pop('bids', None)
+        return network
+
+    def register(self):
+        """Build registry and routing table of network.
+
+        Every device in the tree below self is given a dense integer handle,
+        assigned breadth first from self.  The registry, parent handle, depth
+        and nearest enclosing Gateway (self or an ancestor) of each device are
+        stored in the network graph, indexed by handle.
 
-        # todo: this code could use some polishing
-
-        if not hasattr(self, 'network'):
-            # find an existing network graph
-            if hasattr(self, 'children'):
-                for i in self.children:
-                    self.network = i.graph()
-                    self.network.add_node(self)
-                    self.network.add_edge(self, i)
-                    break
+        Returns:
+            (list) devices indexed by handle.
+        """
+        registry = [self]
+        parents = [None]
+        depths = [0]
+        seen = set([id(self)])
+        for handle, node in enumerate(registry):
+            for child in getattr(node, 'children', None) or []:
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    registry.append(child)
+                    parents.append(handle)
+                    depths.append(depths[handle] + 1)
+        gateways = []
+        for handle, node in enumerate(registry):
+            node.handle = handle
+            if type(node) is Gateway:
+                gateways.append(handle)
+            elif parents[handle] is None:
+                gateways.append(None)
             else:
-                self.network = nx.Graph()
-                self.network.add_node(self)
+                gateways.append(gateways[parents[handle]])
+        self.network.graph.update(registry=registry, parents=parents,
+                                  depths=depths, gateways=gateways)
+        self.network.graph.pop('bids', None)  # bids hold handles
+        return registry
 
-        if hasattr(self, 'children'):
-            for i in self.children:
-                c = i.graph()
-                if c != self.network:
-                    self.network.add_nodes_from(c.nodes())
-                    self.network.add_edges_from(c.edges())
-                    self.network.add_edge(self, i)
-                    for node in i.network:
-                        node.network = self.network
-                else:
-                    self.network.add_edge(self, i)
-
-        return self.network
-
-    def find_node(self, obj_id):
-        for node in self.network:
-            if id(node) == obj_id:
-                return node
-        for i in self.network:
-            print('%s,%s' % (i, id(i)))
+    def routes(self):
+        """Routing table of network.
+
+        The table is built by the root of the network when first needed after
+        the network changes, so nesting gateways does not register every
+        level of the tree again.
+
+        Returns:
+            (dict) attributes of network graph.
+        """
+        graph = self.network.graph
+        if 'registry' not in graph:
+            graph.get('root', self).register()
+        return graph
+
+    def find_node(self, handle):
+        """Device with registry handle."""
+        registry = self.routes()['registry']
+        if handle is None or not 0 <= handle < len(registry):
+            raise KeyError('Node %s not found' % handle)
+        return registry[handle]
 
-        raise KeyError('Node %s not found' % obj_id)
+    def lca(self, a, b):
+        """Lowest common ancestor of two devices.
+
+        Args:
+            a (int): registry handle.
+            b (int): registry handle.
+
+        Returns:
+            (int) handle of ancestor.
+        """
+        graph = self.routes()
+        parents = graph['parents']
+        depths = graph['depths']
+        while depths[a] > depths[b]:
+            a = parents[a]
+        while depths[b] > depths[a]:
+            b = parents[b]
+        while a != b:
+            a = parents[a]
+            b = parents[b]
+        return a
+
+    def first_gateway(self, a, b):
+        """First Gateway on path from device a to device b.
+
+        Args:
+            a (int): registry handle.
+            b (int): registry handle.
+
+        Returns:
+            (int) handle of Gateway or None.
+        """
+        graph = self.routes()
+        parents = graph['parents']
+        depths = graph['depths']
+        gateways = graph['gateways']
+        top = depths[self.lca(a, b)]
+        g = gateways[a]
+        if g is not None and depths[g] >= top:
+            return g
+        # gateway nearest the common ancestor on the way down to b
+        first = None
+        g = gateways[b]
+        while g is not None and depths[g] > top:
+            first = g
+            g = gateways[parents[g]]
+        return first
+
+    def reaches(self, handle):
+        """Whether energy from self may reach a device.
+
+        Energy leaves the domains of self below the lowest common ancestor
+        of self and the device, none of them may be an island.
+
+        Args:
+            handle (int): registry handle of device.
+
+        Returns:
+            (bool)
+        """
+        graph = self.routes()
+        parents = graph['parents']
+        depths = graph['depths']
+        gateways = graph['gateways']
+        registry = graph['registry']
+        top = depths[self.lca(self.handle, handle)]
+        g = gateways[self.handle]
+        while g is not None and depths[g] > top:
+            if registry[g].island():
+                return False
+            parent = parents[g]
+            g = None if parent is None else gateways[parent]
+        return True
 
     def path(self, node):
-        """Shortest path to node."""
-        return nx.shortest_path(self.network, self, node)
+        """Path through network from self to node."""
+        graph = self.routes()
+        parents = graph['parents']
+        registry = graph['registry']
+        a = self.handle
+        b = node.handle
+        top = self.lca(a, b)
+        up = []
+        while a != top:
+            up.append(registry[a])
+            a = parents[a]
+        down = []
+        while b != top:
+            down.append(registry[b])
+            b = parents[b]
+        up.append(registry[top])
+        return up + down[::-1]
 
 
 class Device(Model):
@@ -71,8 +259,15 @@ class Device(Model):
     The premise of this tool is that Devices have LCA values.  This class is
     inherited to create the modeling framework.
 
+    Parameters are rolled up from children.  The devices that report a
+    parameter are found once and summed when the parameter is asked for, so
+    parameters of devices, such as PV ratings and storage capacities, may
+    change freely.  The structure is cached at the revision of the tree,
+    which is incremented when the children of any device of the tree are
+    set.  Children are a tuple, so they are only changed by setting them.
+
     Attributes:
-        children: (list) list of children.
+        children: (tuple) devices below this device.
         device_co2: (float) kg co2 eq footprint.
         device_tox: (float) device toxicity.
         device_cost: (float) device cost.
@@ -89,6 +284,77 @@ class Device(Model):
         self.device_area = 0.
         self.name = 'Device'
 
+    def _get_children(self):
+        return self.__dict__.get('_children', ())
+
+    def _set_children(self, children):
+        children = tuple(children or ())
+        self._children = children
+        # the tree below joins the tree of self, which has changed
+        tree = self._tree()
+        stack = list(children)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Device) and \
+                    node.__dict__.get('_revision') is not tree:
+                node._revision = tree
+                stack.extend(node.children)
+        tree[0] += 1
+
+    children = property(_get_children, _set_children,
+                        doc='Devices below this device.')
+
+    def _tree(self):
+        """Returns: (list) revision of tree, shared by its devices."""
+        tree = self.__dict__.get('_revision')
+        if tree is None:
+            tree = self._revision = [0]
+        return tree
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_rollup_cache', None)  # holds bound methods
+        return state
+
+    def _rollups(self):
+        """Returns: (dict) rollups cached at current revision of tree."""
+        tree = self._tree()
+        cache = self.__dict__.get('_rollup_cache')
+        if cache is None or cache[0] is not tree or cache[1] != tree[0]:
+            cache = (tree, tree[0], {})
+            self._rollup_cache = cache
+        return cache[2]
+
+    def contributors(self, name):
+        """Devices reporting parameter name below this device.
+
+        Children whose parameter is itself a rollup are expanded in place.
+
+        Args:
+            name (string): name of parameter function.
+
+        Returns:
+            (tuple) devices whose device_ attribute of the parameter counts
+            and list of parameter methods.
+        """
+        key = ('contributors', name)
+        rollups = self._rollups()
+        if key not in rollups:
+            constants = []
+            methods = []
+            for i in self.children:
+                if hasattr(i, name):
+                    method = getattr(i, name)
+                    if getattr(method, 'rollup', False):
+                        c, m = i.contributors(name)
+                        constants += c
+                        methods += m
+                    else:
+                        methods.append(method)
+            constants.append(self)
+            rollups[key] = (constants, methods)
+        return rollups[key]
+
     def parameter(self, name):
         """Default parameter method.
 
@@ -101,17 +367,16 @@ class Device(Model):
             (float): sum of parameter for all decendants.
 
         """
-        # This is redundant with node_iter
+        constants, methods = self.contributors(name)
+        attribute = 'device_%s' % name
         v = 0.
-        if hasattr(self, 'children'):
-            for i in self.children:
-                if hasattr(i, name):
-                    v += getattr(i, name)()
-        if hasattr(self, 'device_%s' % name):
-            v += getattr(self, 'device_%s' % name)
+        for method in methods:
+            v += method()
+        for device in constants:
+            v += getattr(device, attribute, 0.)
         return v
 
-
+    @rollup
     def co2(self):
         """CO2 eq footprint.
 
@@ -120,6 +385,7 @@ class Device(Model):
         """
         return self.parameter('co2')
 
+    @rollup
     def tox(self):
         """Toxicity footprint.
 
@@ -128,6 +394,7 @@ class Device(Model):
         """
         return self.parameter('tox')
 
+    @rollup
     def cost(self):
         """Device cost.
 
@@ -136,6 +403,7 @@ class Device(Model):
         """
         return self.parameter('cost')
 
+    @rollup
     def area(self):
         """Device footprint.
 
@@ -144,39 +412,53 @@ class Device(Model):
         """
         return self.parameter('area')
 
+    def nodes(self):
+        """Devices of network in a fixed order, listed once per network.
+
+        Markets settle ties between equal offers in this order.  It is kept
+        with the network, so copies of a system settle ties alike.
+
+        Returns:
+            (list)
+        """
+        graph = self.network.graph
+        if 'nodes' not in graph:
+            graph['nodes'] = list(self.network)
+        return graph['nodes']
+
     def connected_domains(self):
-        # isdomain = lambda x: (type(x) is Domain) and (x is not self)
-        isdomain = lambda x: (type(x) is Gateway)
-        return filter(isdomain, self.network)
+        """Gateways of network, found once per network.
+
+        Returns:
+            (list)
+        """
+        graph = self.network.graph
+        if 'domains' not in graph:
+            isdomain = lambda x: (type(x) is Gateway)
+            graph['domains'] = filter(isdomain, self.nodes())
+        return graph['domains']
 
-    def dest_gateway(self, obj_id):
-        """find dest obj_id's input gateway
+    def dest_gateway(self, handle):
+        """find dest handle's input gateway
 
         Returns:
             Gateway
         """
+        g = self.first_gateway(handle, self.handle)
+        if g is None:
+            raise KeyError('Gateway for %s not found' % handle)
+        return self.find_node(g)
 
-        node = self.find_node(obj_id)
-        for step in reversed(self.path(node)):
-            if type(step) is Gateway:
-                return step
-        print 'dest', obj_id, 'self', id(self)
-        print self.path(node)
-        raise KeyError('Gateway for %s not found' % obj_id)
-
-    def src_gateway(self, obj_id):
-        """find output gateway from self to dest obj_id
+    def src_gateway(self, handle):
+        """find output gateway from self to dest handle
 
         Returns:
             Gateway
         """
-        node = self.find_node(obj_id)
-        for step in self.path(node):
-            if type(step) is Gateway:
-                return step
-        print obj_id, id(self)
-        print self.path(node)
-        raise KeyError('Gateway for %s not found' % obj_id)
+        g = self.first_gateway(self.handle, handle)
+        if g is None:
+            raise KeyError('Gateway for %s not found' % handle)
+        return self.find_node(g)
 
     def __repr__(self):
         return self.name
@@ -194,48 +476,63 @@ class Gateway(Device):
         net_l: (list) enabled load (Wh).
         loss_occurence: (int) loss (Wh).
         shortfall: (float) total energy shortfall (Wh).
+        step_hours: (Column) hours of each step calculated.
     """
 
-    def __init__(self, children=None, merit=None):
+    def __init__(self, children=None, merit=None, context=None, market=None):
         """Should have at least one child but should probably have two.
 
         Args:
             children (list): loads, storage, and generation
+            merit (object): merit calculation (default STEEPMerit).
+            market (class): market clearing of bids to this domain, Auction
+                (default) or OrderBook.
+            context (SimulationContext): binds all devices in the network to
+                context, unbound devices use the current context.
         """
         super(Gateway, self).__init__()
         self.children = children
-        self.small_id = SMALL_ID.next(type(self))
         self.g = []
         self.l = []
         self.d = []
         self.state_series = []
         self.hours = []
-        self.time_series = []
+        self.first_step = None
+        self.stop_step = None  # last step calculated + 1
         self.net_g = []  # used generation
         self.net_l = []  # enabled load
         self.shortfall = 0.
         self.domain_r = 1.
-        self.credits = {}
-        self.debits = {}
-        self.balance = {}
-        self.demand = {}
-        self.outage = {}
-        self.source = {}
+        self.ledger = Ledger(LEDGERS)
+        self.credits = self.ledger['credits']
+        self.debits = self.ledger['debits']
+        self.balance = self.ledger['balance']
+        self.demand = self.ledger['demand']
+        self.outage = self.ledger['outage']
+        self.source = self.ledger['source']
+        self.step_hours = self.ledger['hours']
         self.lolh = 0.
         self.network = self.graph()
+        self.network.graph['root'] = self
+        if context is not None:
+            self.bind(context)
+        self.small_id = self.context.ids.next(type(self))
         self.export_power = True
+        self.island_power = False
         if merit is None:
             self.system_merit = STEEPMerit()
         else:
             self.system_merit = merit
+        if market is None:
+            self.market = Auction
+        else:
+            self.market = market
 
     def autonomy(self):
         """Calculate domain autonomy.
 
         Returns:
-            (float) hours
-
-        Note: assumes hour time intervals
+            (float) hours of mean load.
 
         """
         # g_ave = sum(self.g)/len(self.g)
@@ -245,13 +542,29 @@ class Gateway(Device):
         for node in self.network.neighbors(self):
             if hasattr(node, 'dmnd') and type(node) is not Gateway:
                 # net_l += np.median(node.dmnd.values())
-                net_l += abs(np.mean(node.dmnd.values()))
-        return self.domain_capacity() / net_l
+                net_l += abs(node.dmnd.sum())
+        return self.domain_capacity() / (net_l / self.step_hours.sum())
+
+    def max_load(self, hours=48.):
+        """Largest demand of consecutive steps spanning hours.
 
-    def max_load(self, intervals=48):
-        demand = self.log_dict_to_list('demand')
-        l_max = min([sum(demand[i:i+intervals]) for i in range(len(demand)-intervals)])
-        return l_max
+        Steps need not be of equal length.
+
+        Returns:
+            (float) Wh, demands are negative.
+        """
+        demand = self.log_values('demand')[:-1]
+        duration = self.log_values('hours')[:len(demand)]
+        end = np.cumsum(duration)
+        start = end - duration
+        # first step of the window ending with each step
+        first = np.searchsorted(start, end - hours - 1e-9)
+        full = end - start[0] >= hours - 1e-9
+        if not full.any():
+            return float(demand.sum())
+        total = np.append(0., np.cumsum(demand))
+        last = np.arange(len(demand))[full]
+        return float((total[last + 1] - total[first[full]]).min())
 
     def domain_capacity(self):
         capacity = 0
@@ -290,13 +603,14 @@ class Gateway(Device):
     def capacity_factor(self):
         """Capacity Factor Cf
 
-        .. math:: C_{f} = \\frac{\\sum{Loads}}{G_{P}\\cdot 365 \\cdot 24}
+        .. math:: C_{f} = \\frac{\\sum{Loads}}{G_{P}\\cdot T}
 
-        Where Gp is peak generation
+        Where Gp is peak generation and T is hours simulated.
 
         """
-        if self.STC():
-            return sum(self.net_l)/(self.STC()*24*365)
+        hours = self.step_hours.sum()
+        if self.STC() and hours:
+            return sum(whole(self.net_l))/(self.STC()*hours)
         else:
             return 0.
 
@@ -305,32 +619,68 @@ class Gateway(Device):
             self.export_power = state
         return self.export_power
 
-    def log_dict_to_list(self, log_dict, default=0):
-        return [getattr(self, log_dict).setdefault(i, default)
-                for i in self.time_series]
+    def island(self, state=None):
+        """Whether sources inside offer energy only inside the domain.
+
+        Sources offer to every domain whether it exports or not, an island
+        keeps their energy in.  Off unless set.
+
+        Args:
+            state (bool): set island.
+
+        Returns:
+            (bool)
+        """
+        if state is not None:
+            self.island_power = state
+        return self.island_power
+
+    def log_values(self, name):
+        """Ledger values of steps calculated.
+
+        Args:
+            name (str): credits, debits, balance, demand, outage or source.
+
+        Returns:
+            (ndarray) view of ledger, not a copy.
+        """
+        if self.first_step is None:
+            return np.empty(0)
+        return self.ledger.values(name, self.first_step, self.stop_step)
+
+    def log_dict_to_list(self, log_dict):
+        """Ledger values of steps calculated.
+
+        Args:
+            log_dict (str): credits, debits, balance, demand, outage or source.
+
+        Returns:
+            (list)
+        """
+        return self.log_values(log_dict).tolist()
 
     def details(self):
         """Create dict of metrics."""
         results = {
-            'Demand (Wh)': significant(sum(self.log_dict_to_list('demand'))),
-            'Net (Wh)': significant(sum(self.log_dict_to_list('balance'))),
+            'Demand (Wh)': significant(self.demand.sum()),
+            'Net (Wh)': significant(self.balance.sum()),
             'Domain sources (Wh)':
-                significant(sum(self.log_dict_to_list('source'))),
+                significant(self.source.sum()),
             'Domain credits (Wh)':
-                significant(sum(self.log_dict_to_list('credits'))),
+                significant(self.credits.sum()),
             'Domain debits (Wh)':
-                significant(sum(self.log_dict_to_list('debits'))),
+                significant(self.debits.sum()),
             'Domain Generation losses (Wh)':
             significant(self.parameter('losses')),
             'Autonomy (hours) (mean load/C)': significant(self.autonomy()),
-            '%s hour max load' % 48: significant(self.max_load(48)),
+            '%s hour max load' % 48: significant(self.max_load(48.)),
             # 'Capacity Factor (%)': significant(self.capacity_factor()*100.),
             'Domain surplus (Wh)': significant(self.surplus()),
             # 'Domain Generation (Wh)': significant(sum(self.g)),
             'Domain Parts (USD)': significant(self.cost()),
             'Domain depletion (USD)': significant(self.depletion()),
             'Domain LOLH (hours)': significant(self.lolh),
-            'Domain outages (n)': significant(sum(self.outage.values())),
+            'Domain outages (n)': significant(int(self.outage.sum())),
             'Domain shortfall (Wh)': significant(self.shortfall),
             'A (m2)': significant(self.parameter('area')),
             # 'Toxicity (CTUh)': significant(self.tox()),
@@ -359,60 +709,69 @@ class Gateway(Device):
             self(i)
 
     def reconcile(self):
-        key = env.time
+        step = self.context.step
         for child in self.children:
             if type(child) == Gateway:
-                # print self.balance[key], self.credits[key],
-                # self.debits[key], self.balance[key]
-                if self.balance[key]:
+                # print self.balance[step], self.credits[step],
+                # self.debits[step], self.balance[step]
+                if self.balance[step]:
                     pass
 
     def transaction(self, offer, bid):
         # transer energy from destination bid to source offer
-        key = env.time
-        dest = self.find_node(bid.obj_id)
+        key = self.context.time
+        step = self.context.step
+        dest = self.find_node(bid.handle)
         delta = min(abs(dest.needsenergy()), offer.wh)
         if delta == 0.:
             logger.error('Transaction for 0, offer was %s', offer)
         # add to bid destination
         dest.power_io(delta)
-        # self.demand[key] += delta
-        self.balance[key] += delta
-        self.credits[key] += delta
+        # self.demand[step] += delta
+        self.balance[step] += delta
+        self.credits[step] += delta
         # subtract from offer source
-        source = self.find_node(offer.obj_id)
+        source = self.find_node(offer.handle)
         source.power_io(-delta)
-        source_domain = self.dest_gateway(offer.obj_id)
-        source_domain.debits[key] -= delta
-        source_domain.balance[key] -= delta
+        source_domain = self.dest_gateway(offer.handle)
+        source_domain.debits[step] -= delta
+        source_domain.balance[step] -= delta
         logger.info('%s: Transfered %s Wh from %s toward %s Wh in %s',
                     key, delta, source, bid.wh, dest)
         return True
 
-    def get_energy(self, bid):
-        # energy auction
-        key = env.time
-        node = self.find_node(bid.obj_id)
+    def get_energy(self, bid, market=None):
+        """Settle bid with offers from market.
+
+        Args:
+            bid (Bid): from device in domain.
+            market (Auction): market of current step (default new market of
+                domain).
+        """
+        key = self.context.time
+        step = self.context.step
+        if market is None:
+            market = self.market(self.nodes())
+        node = self.find_node(bid.handle)
         # initial_demand = node.needsenergy()
-        initial_demand = self.demand[key]
+        initial_demand = self.demand[step]
         logger.debug("New auction %s for %s Wh", key, initial_demand)
-        offer = low_offer(self.network, bid)
-        while offer and node.needsenergy():
+        for offer in market.offers(bid):
+            if not node.needsenergy():
+                break
             logger.debug('High bid %s, Low Offer %s', bid, offer)
             self.transaction(offer, bid)
-            offer = None
-            offer = low_offer(self.network, bid)
 
         # account for shortage
         if node.needsenergy() != 0. and not bid.storage:
-            # print self.balance[key], bid.storage
-            logger.warning("Shortfall of %s, in %s for %s", self.balance[key],
+            # print self.balance[step], bid.storage
+            logger.warning("Shortfall of %s, in %s for %s", self.balance[step],
                            self, node)
-            self.outage[env.time] = 1
+            self.outage[step] = 1
             self.shortfall += node.needsenergy()
             # todo: there might be a bug here
             # self.lolh += self.timestep - (initial_demand-node.needsenergy())\
-            self.lolh += self.timestep - (initial_demand - self.demand[key]) \
+            self.lolh += self.timestep - (initial_demand - self.demand[step]) \
                 / initial_demand * self.timestep
             return False
         return True
@@ -425,53 +784,88 @@ class Gateway(Device):
         from the device with the lowest offer.
 
         Args:
-            hours (float):
+            hours (float): length of step, steps need not be of equal length.
 
         Returns:
             (float): net energy surplus or shortfall (Wh).
 
         """
         self.hours.append(hours)
-        key = env.time
+        key = self.context.time
+        step = self.context.step
+        graph = self.routes()
 
         logger.debug('Start processsing %s', key)
         # init
         for node in self.connected_domains():
             node.timestep = hours
-            node.time_series.append(key)
-            node.credits[key] = 0.
-            node.demand[key] = 0.
-            node.debits[key] = 0.
-            node.balance[key] = 0.
-
-        # total non-droopable energy demand
-
-        for node in self.connected_domains():
-            node_dmnd = node.needsenergy() * (1.-node.droopable())
-            node.demand[key] = node.demand.setdefault(key, 0) + node_dmnd
-
-        # total energy with curtailment penalties
-        for node in self.connected_domains():
-            node.source[key] = node.hasenergy() * node.curtailment_ratio()
-
-        for node in self.connected_domains():
-            # demands are always negative
-            node.balance[key] = node.source[key] + node.demand[key]
+            if node.first_step is None:
+                node.first_step = step
+            node.stop_step = step + 1
+            node.credits[step] = 0.
+            node.debits[step] = 0.
+            node.step_hours[step] = hours
+            # total non-droopable energy demand and energy with curtailment
+            # penalties, demands are always negative
+            demand, source = node.evaluate()
+            node.demand[step] = demand
+            node.source[step] = source
+            node.balance[step] = source + demand
 
         # rebalance power neglecting transmission costs/constraints
         # find demand with highest priority
-        bids = rank_bids(self.network)
+        if 'bids' not in graph:
+            graph['bids'] = BidBook(self.nodes())
+        bids = graph['bids'].bids()
         if len(bids) == 0:
             logger.info('%s no bids.', key)
 
+        markets = {}
         for bid in bids:
             logger.debug('current energy priority: %s', bid)
-            dest = self.dest_gateway(bid.obj_id)
+            dest = self.dest_gateway(bid.handle)
             logger.debug('Transfering control to %s', dest)
-            dest.get_energy(bid)
+            if dest.market not in markets:
+                markets[dest.market] = dest.market(self.nodes())
+            dest.get_energy(bid, markets[dest.market])
 
         # self.reconcile()
 
+    def evaluate(self):
+        """Energy of children at the start of a step.
+
+        Each child is asked for its energy once, and the values are shared by
+        the demand, droop, supply and curtailment aggregates of the step.
+
+        Returns:
+            (tuple) non-droopable demand (Wh, negative) and energy with
+            curtailment penalties (Wh).
+        """
+        rollups = self._rollups()
+        if 'evaluate' not in rollups:
+            children = [i for i in self.children if type(i) is not Gateway]
+            rollups['evaluate'] = (
+                [i for i in children if hasattr(i, 'needsenergy')],
+                [i for i in children if hasattr(i, 'hasenergy')])
+        consumers, suppliers = rollups['evaluate']
+        need = 0.
+        droop = 0.
+        for i in consumers:
+            ce = i.needsenergy()
+            need += ce
+            droop += ce*i.droopable()
+        if need:
+            droop = droop/need
+        has = 0.
+        curtailed = 0.
+        for i in suppliers:
+            ce = i.hasenergy()
+            has += ce
+            curtailed += ce*i.curtailment_ratio()
+        if has:
+            curtailed = curtailed/has
+        return need * (1.-droop), has * curtailed
+
     def needsenergy(self):
         e = 0
         for i in self.children:
@@ -524,9 +918,10 @@ class Gateway(Device):
         g = 0
         for i in self.network.neighbors(self):
             if hasattr(i, 'generation') and type(i) is not Gateway:
-                g += sum(i.balance.values())
+                g += i.balance.sum()
         return g
 
+    @rollup
     def depletion(self):
         return self.parameter('depletion')
 
@@ -541,7 +936,7 @@ class Gateway(Device):
 
     def __repr__(self):
         return 'Domain %s, %s Outages' % (self.small_id,
-                                          sum(self.outage.values()))
+                                          int(self.outage.sum()))
         # significant(self.cost())
 
 
@@ -26,47 +26,53 @@ class Bid(object):
 
     """Bid Class."""
 
-    def __init__(self, obj_id, wh, value):
+    __slots__ = ('handle', 'value', 'wh', 'storage')
+
+    def __init__(self, handle, wh, value, storage=False):
         """Initialize.
 
         Args:
-            obj_id (int): of device from which bid came.
+            handle (int): registry handle of device from which bid came.
             wh (float): amount of needed.
             value (float): at which energy will be bought.
+            storage (bool): bid is to store energy.
         """
-        self.obj_id = obj_id
+        self.handle = handle
         self.value = value
         self.wh = wh
-        self.storage = False
+        self.storage = storage
 
     def __repr__(self):
-        return '%s %s wh %s' % (self.obj_id, self.wh, self.value)
+        return '%s %s wh %s' % (self.handle, self.wh, self.value)
 
 
 class Offer(object):
 
     """Offer class."""
 
-    def __init__(self, obj_id, wh, value):
+    __slots__ = ('handle', 'value', 'wh', 'storage')
+
+    def __init__(self, handle, wh, value, storage=False):
         """Initialize.
 
         Args:
-            obj_id (int): of device from which offer came.
+            handle (int): registry handle of device from which offer came.
             wh (float): of energy needed.
             value (float): at which energy will be sold.
+            storage (bool): offer is of stored energy.
         """
-        self.obj_id = obj_id
+        self.handle = handle
         self.value = value
         self.wh = wh
-        self.storage = False
+        self.storage = storage
 
     def __repr__(self):
-        return '%s %s wh %s' % (self.obj_id, self.wh, self.value)
+        return '%s %s wh %s' % (self.handle, self.wh, self.value)
 
 
 def high_bid(nodes, offer=None):
     if offer is None:
-        offer = Offer(0, 0, 0)
+        offer = Offer(None, 0, 0)
     high_bid = None
     bid_value = 0.
     for node in nodes:
@@ -75,7 +81,7 @@ def high_bid(nodes, offer=None):
             if bid:
                 logger.debug('bid %s', bid)
                 if (bid.value > bid_value) \
-                    and (bid.obj_id != offer.obj_id) \
+                    and (bid.handle != offer.handle) \
                     and not (bid.storage and offer.storage):
                     logger.debug('new high_bid %s', bid)
                     bid_value = bid.value
@@ -96,26 +102,148 @@ def rank_bids(nodes):
     return bids
 
 
+class BidBook(object):
+
+    """Bidders of a network ranked once by value.
+
+    Bid values are constant during a run, so bidders are sorted once per
+    topology in the same order as rank_bids, and each step only bidders
+    that need energy bid.  The standing bid of each bidder is reused from
+    step to step.  Bidders are ranked again when a value changes, e.g. the
+    per_kwh of a load in a fork of a snapshot.
+    """
+
+    def __init__(self, nodes):
+        """Initialize.
+
+        Args:
+            nodes (iterable): devices of network.
+        """
+        book = [(node, node.standing_bid()) for node in nodes
+                if hasattr(node, 'bid')]
+        book.sort(key=lambda x: x[1].value, reverse=True)
+        self.book = book
+
+    def bids(self):
+        """Bids of step in order of priority, high to low."""
+        bids = []
+        ranked = True
+        for node, bid in self.book:
+            value = node.buy_kwh()
+            if value != bid.value:
+                bid.value = value
+                ranked = False
+            e = node.needsenergy()
+            if e:
+                bid.wh = e
+                logger.debug('bid %s', bid)
+                bids.append(bid)
+        if not ranked:
+            self.book.sort(key=lambda x: x[1].value, reverse=True)
+            bids.sort(key=lambda bid: bid.value, reverse=True)
+        return bids
+
+
 def low_offer(nodes, bid):
     """Find lowest offer for bid."""
     if bid is None:
-        bid = Bid(0, 0, 0)
+        bid = Bid(None, 0, 0)
     low_offer = None
     offer_value = 100.
     for node in nodes:
         if hasattr(node, 'offer'):
-            offer = node.offer(bid.obj_id)
+            offer = node.offer(bid.handle)
             # offer = node.offer()
             if offer:
                 logger.debug('offer %s', offer)
                 if (offer.value < offer_value) \
-                    and (offer.obj_id != bid.obj_id) \
+                    and (offer.handle != bid.handle) \
                     and not (bid.storage and offer.storage):
                     low_offer = offer
                     offer_value = offer.value
     return low_offer
 
 
+class Auction(object):
+
+    """Market clearing by auction.
+
+    Every device is asked for an offer after each transaction and the lowest
+    offer is accepted.
+    """
+
+    def __init__(self, nodes):
+        """Initialize.
+
+        Args:
+            nodes (iterable): devices of network.
+        """
+        self.nodes = nodes
+
+    def offers(self, bid):
+        """Successive low offers for bid.
+
+        Each offer is requested after the previous offer has been settled.
+        """
+        offer = low_offer(self.nodes, bid)
+        while offer:
+            yield offer
+            offer = low_offer(self.nodes, bid)
+
+
+class OrderBook(Auction):
+
+    """Market clearing by order book.
+
+    Devices that make offers are sorted once per step by the value at which
+    they sell energy.  Offers for a bid are then taken in order of the book,
+    ties are settled in network order as they are by low_offer, so clearing
+    gives the same transactions as an Auction.
+
+    Offers only shrink while a bid is settled, so a device that has no offer
+    for a bid is passed over for the rest of that bid.  Devices at the head
+    of the book that have no energy left are passed over for the rest of the
+    step, until storage buys energy, so a step is settled in a single pass
+    through the book.
+
+    Attributes:
+        book (list): devices that make offers, in order of value.
+        cursor (int): position in book of the first device that may still
+            have energy.
+    """
+
+    def __init__(self, nodes):
+        super(OrderBook, self).__init__(nodes)
+        book = [node for node in nodes if hasattr(node, 'offer')]
+        book.sort(key=lambda x: x.sell_kwh())
+        self.book = book
+        self.cursor = 0
+        self.charged = False
+
+    def offers(self, bid):
+        if self.charged:
+            # storage bought energy, devices passed over may have some again
+            self.cursor = 0
+        self.charged = bid.storage
+        book = self.book
+        i = self.cursor
+        while i < len(book):
+            node = book[i]
+            while True:
+                offer = node.offer(bid.handle)
+                if not offer or (offer.handle == bid.handle) \
+                        or (bid.storage and offer.storage):
+                    break
+                if offer.value >= 100.:
+                    # rest of book is more expensive
+                    return
+                yield offer
+            # devices excluded from this bid may still offer to others
+            if i == self.cursor and not node.hasenergy():
+                self.cursor += 1
+            i += 1
+
+
 def gini(list_of_values):
     """Calculate Gini coefficient for list of values."""
     sorted_list = sorted(list_of_values)
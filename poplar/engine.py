@@ -0,0 +1,663 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Vectorized simulation of single domain systems.
+
+Most systems are a single Gateway with a load, a charge controller over PV
+modules and a battery.  For these the hourly market comes down to the PV
+serving the load first, the battery serving what is left and the PV charging
+the battery with the rest, so the state of charge is the net energy clipped
+between empty and full.  Generation and demand are calculated for the whole
+run with NumPy, only the clipped recurrence runs step by step.  Every record
+is kept as the market keeps it, so details() reports the same results.
+
+Systems of other shapes are simulated step by step by calling the Gateway.
+
+Sizing sweeps settle a batch of single domain systems that differ in storage
+capacity and PV rating as one array computation.  PV output is calculated
+for each rating from irradiation calculated once and the load does not depend
+on sizing, so a sweep of a grid takes about as long as one simulation.
+
+"""
+import logging
+import numpy as np
+
+from devices import Gateway
+from loads import Load
+from controllers import ChargeController, total_losses
+from sources import SimplePV
+from storage import IdealStorage
+
+# shortfalls are logged as the market logs them
+logger = logging.getLogger(Gateway.__module__)
+
+
+class SingleDomain(object):
+
+    """Load, charge controller and storage in a single Gateway.
+
+    Attributes:
+        gateway (Gateway)
+        load (Load)
+        plant (ChargeController)
+        storage (IdealStorage)
+    """
+
+    def __init__(self, gateway, load, plant, storage):
+        self.gateway = gateway
+        self.load = load
+        self.plant = plant
+        self.storage = storage
+
+    @classmethod
+    def detect(cls, gateway):
+        """Match topology of gateway.
+
+        The market must settle energy in the order the engine does: the load
+        values energy more than storage and PV sells energy for less than
+        storage.
+
+        Args:
+            gateway (Gateway)
+
+        Returns:
+            (SingleDomain) or None if gateway has another topology.
+        """
+        if type(gateway) is not Gateway or len(gateway.children) != 3:
+            return None
+        if gateway.routes()['registry'][0] is not gateway:
+            return None
+        found = {}
+        for child in gateway.children:
+            for name, kind in (('load', Load), ('plant', ChargeController),
+                               ('storage', IdealStorage)):
+                if isinstance(child, kind):
+                    found[name] = child
+        if len(found) != 3:
+            return None
+        load, plant, storage = found['load'], found['plant'], found['storage']
+        if hasattr(load, 'hasenergy') or not plant.children:
+            return None
+        for pv in plant.children:
+            if type(pv) is not SimplePV or \
+                    not hasattr(pv.irr_object, 'energy_series'):
+                return None
+        devices = set([gateway, load, plant, storage])
+        for pv in plant.children:
+            devices.update([pv, pv.irr_object])
+            devices.update(getattr(pv.irr_object, 'children', []))
+        if set(gateway.network) != devices:
+            return None
+        if not (load.buy_kwh() > storage.buy_kwh() and
+                plant.sell_kwh() < storage.sell_kwh() < 100.):
+            return None
+        if plant.needsenergy() or plant.droopable():
+            return None
+        return cls(gateway, load, plant, storage)
+
+    def run(self, times, hours=1.):
+        """Simulate times.
+
+        Args:
+            times (list): datetime of each step.
+            hours (float or array_like): hours per step, or of each step.
+        """
+        gateway = self.gateway
+        load = self.load
+        plant = self.plant
+        storage = self.storage
+        context = gateway.context
+
+        n = len(times)
+        if not n:
+            return
+        start = context.step + 1
+        step_hours = step_lengths(hours, n)
+        rows = []
+        for dt, h in zip(times, step_hours.tolist()):
+            context.update_time(dt, h)
+            rows.append(context.row)
+        demand = load.demand_series(times) * step_hours
+        generation = plant.output_series(context.weather.take(rows), start,
+                                         step_hours)
+
+        # constants of the market
+        l_droop = load.droopable()
+        s_droop = storage.droopable()
+        p_curtail = plant.curtailment_ratio()
+        s_curtail = storage.curtailment_ratio()
+        s_offers = storage.sell_kwh() < 100.
+        cap = float(storage.nominal_capacity)
+
+        # ledgers
+        source = []
+        g_demand = []
+        g_balance = []
+        credits = []
+        debits = []
+        l_balance = []
+        p_balance = []
+        p_debits = []
+        soc = [np.nan] * n
+
+        # storage records
+        s = storage.state
+        throughput = storage.throughput
+        surplus = storage.surplus
+        full_hours = storage.full_hours
+        drained_hours = storage.drained_hours
+        s_shortfall = storage.shortfall
+        loss_occurence = storage.loss_occurence
+        c_in = storage.c_in
+        c_out = storage.c_out
+        s_hour_log = storage.hours
+        state_series = storage.state_series
+
+        shortfall = gateway.shortfall
+        lolh = gateway.lolh
+
+        for k, (d, g, s_hours) in enumerate(zip(demand.tolist(),
+                                                generation.tolist(),
+                                                step_hours.tolist())):
+            s_need = s - cap
+
+            # domain demand and source as in Gateway.calc
+            e = d + s_need
+            droop = d * l_droop + s_need * s_droop
+            if e:
+                dmnd = 0. + e * (1. - droop / e)
+            else:
+                dmnd = 0. + e * 1.
+            e = g + s
+            c = g * p_curtail + s * s_curtail
+            if e:
+                src = e * (c / e)
+            else:
+                src = e * 0.
+            balance = src + dmnd
+            credit = 0.
+            debit = 0.
+
+            # load bid, PV is offered first then storage
+            need = d
+            pv = g
+            pv_debit = 0.
+            while d:
+                if pv:
+                    delta = min(abs(need), pv)
+                    need += delta
+                    balance += delta
+                    credit += delta
+                    pv += -delta
+                    pv_debit += -delta
+                elif s and s_offers:
+                    delta = min(abs(need), s)
+                    need += delta
+                    balance += delta
+                    credit += delta
+                    # discharge as IdealStorage.power_io
+                    energy = -delta
+                    s_hour_log.append(s_hours)
+                    c_out.append(energy/s_hours/cap)
+                    e_delta = - min(-energy, s)
+                    if e_delta != energy:
+                        short = s + energy
+                        s_shortfall += short
+                        drained_hours += short/energy * s_hours
+                        loss_occurence += 1
+                    s += e_delta
+                    soc[k] = s/cap
+                    state_series.append(soc[k])
+                else:
+                    break
+                debit -= delta
+                balance -= delta
+                if not need:
+                    break
+            if d and need != 0.:
+                logger.warning("Shortfall of %s, in %s for %s", balance,
+                               gateway, load)
+                gateway.outage[start + k] = 1
+                shortfall += need
+                # Gateway.calc takes initial demand less the demand of the
+                # step, both the same, so a shortfall counts the whole step
+                lolh += s_hours
+
+            # storage bid, PV charges storage with what is left
+            if s_need:
+                while pv:
+                    s_need = s - cap
+                    if not s_need:
+                        break
+                    delta = min(abs(s_need), pv)
+                    # charge as IdealStorage.power_io
+                    s_hour_log.append(s_hours)
+                    c_in.append(delta/s_hours/cap)
+                    e_delta = min(delta, cap - s)
+                    s += e_delta
+                    if e_delta != delta:
+                        over = delta - e_delta
+                        surplus += over
+                        full_hours += s_hours - over/delta * s_hours
+                    throughput += e_delta
+                    soc[k] = s/cap
+                    state_series.append(soc[k])
+                    balance += delta
+                    credit += delta
+                    pv += -delta
+                    pv_debit += -delta
+                    debit -= delta
+                    balance -= delta
+
+            source.append(src)
+            g_demand.append(dmnd)
+            g_balance.append(balance)
+            credits.append(credit)
+            debits.append(debit)
+            l_balance.append(need)
+            p_balance.append(pv)
+            p_debits.append(pv_debit)
+
+        storage.state = s
+        storage.throughput = throughput
+        storage.surplus = surplus
+        storage.full_hours = full_hours
+        storage.drained_hours = drained_hours
+        storage.shortfall = s_shortfall
+        storage.loss_occurence = loss_occurence
+        storage.step_soc.put(start, soc)
+
+        load.dmnd.put(start, demand)
+        load.balance.put(start, l_balance)
+        plant.generation.put(start, generation)
+        plant.balance.put(start, p_balance)
+        plant.debits.put(start, p_debits)
+
+        gateway.shortfall = shortfall
+        gateway.lolh = lolh
+        gateway.timestep = float(step_hours[-1])
+        gateway.hours.extend(step_hours.tolist())
+        if gateway.first_step is None:
+            gateway.first_step = start
+        gateway.stop_step = start + n
+        gateway.source.put(start, source)
+        gateway.demand.put(start, g_demand)
+        gateway.balance.put(start, g_balance)
+        gateway.credits.put(start, credits)
+        gateway.debits.put(start, debits)
+        gateway.step_hours.put(start, step_hours)
+
+    def settle(self, demand, generation, capacity, hours=1.):
+        """Settle the market of a batch of systems at once.
+
+        Systems of the batch differ in demand, generation or storage capacity
+        and start with full storage.  Steps are settled as run settles them,
+        as array operations across the batch.
+
+        Args:
+            demand (ndarray): Wh of each step, or of each system and step.
+            generation (ndarray): Wh of each step, or of each system and step.
+            capacity (ndarray): storage capacity (Wh) of each system.
+            hours (float or array_like): hours per step, or of each step.
+
+        Returns:
+            (dict) arrays of shortfall (Wh), lolh (hours), outages (n),
+            throughput (Wh), surplus (Wh) of unused generation and state (Wh)
+            of storage after the last step of each system.
+        """
+        demand = np.asarray(demand, dtype=float)
+        generation = np.asarray(generation, dtype=float)
+        cap = np.asarray(capacity, dtype=float)
+        if (demand > 0).any() or (generation < 0).any():
+            raise ValueError('Demand must not be positive and generation '
+                             'must not be negative')
+        steps = demand.shape[-1]
+        step_hours = step_lengths(hours, steps).tolist()
+        # one row per step, broadcast across the batch
+        demand = demand.T if demand.ndim == 2 else demand[:, None]
+        generation = generation.T if generation.ndim == 2 \
+            else generation[:, None]
+
+        s_offers = self.storage.sell_kwh() < 100.
+        zero = np.zeros_like(cap)
+
+        s = cap.copy()
+        throughput = zero.copy()
+        shortfall = zero.copy()
+        lolh = zero.copy()
+        outages = np.zeros(len(cap), dtype=int)
+        surplus = zero.copy()
+        for k in range(steps):
+            d = demand[k] + zero
+            pv = generation[k] + zero
+            s_need = s - cap
+            bid = d != 0
+
+            # PV serves load
+            m = bid & (pv != 0)
+            delta = np.where(m, np.minimum(np.abs(d), pv), 0.)
+            need = d + delta
+            pv = pv - delta
+
+            # storage serves what is left
+            if s_offers:
+                m = bid & (need != 0) & (s != 0)
+                delta = np.where(m, np.minimum(np.abs(need), s), 0.)
+                need = need + delta
+                s = s - delta
+
+            short = bid & (need != 0)
+            if short.any():
+                outages += short
+                shortfall += np.where(short, need, 0.)
+                h = step_hours[k]
+                # the whole step, as Gateway.calc counts it
+                lolh += np.where(short, h, 0.)
+
+            # PV charges storage with the rest
+            m = s_need != 0
+            while True:
+                s_need = s - cap
+                m &= (pv != 0) & (s_need != 0)
+                if not m.any():
+                    break
+                delta = np.where(m, np.minimum(np.abs(s_need), pv), 0.)
+                e_delta = np.where(m, np.minimum(delta, cap - s), 0.)
+                s = s + e_delta
+                throughput = throughput + e_delta
+                pv = pv - delta
+            surplus += pv
+        return {'shortfall': shortfall, 'lolh': lolh, 'outages': outages,
+                'throughput': throughput, 'surplus': surplus, 'state': s}
+
+    def sweep(self, capacities, ratings, times, hours=1.):
+        """Simulate every pair of storage capacity and PV rating.
+
+        The system is not simulated or changed.  Irradiation is calculated
+        once and shared by every PV rating.
+
+        Args:
+            capacities (array_like): storage capacities (Wh).
+            ratings (array_like): PV STC ratings (W).
+            times (list): datetime of each step.
+            hours (float or array_like): hours per step, or of each step.
+
+        Returns:
+            (Sweep)
+        """
+        if len(self.plant.children) != 1:
+            raise ValueError('Sweeps need a single PV module')
+        capacities = np.asarray(capacities, dtype=float)
+        ratings = np.asarray(ratings, dtype=float)
+        module = self.plant.children[0]
+        weather = self.gateway.context.weather
+        weather = weather.take(weather.rows(times))
+        step_hours = step_lengths(hours, len(times))
+        demand = self.load.demand_series(times) * step_hours
+        irr = module.irr_object.energy_series(weather)
+
+        generation = []
+        losses = []
+        for rating in ratings:
+            vi = SimplePV(rating, module.irr_object).output_series(weather,
+                                                                   irr=irr)
+            w, loss = self.plant.convert([vi])
+            generation.append(w * step_hours)
+            losses.append(total_losses([l * step_hours for l in loss]))
+
+        n_pv = len(ratings)
+        grid = (len(capacities), n_pv)
+        pv_index = np.tile(np.arange(n_pv), len(capacities))
+        results = self.settle(demand, np.array(generation)[pv_index],
+                              np.repeat(capacities, n_pv), step_hours)
+        results = dict((k, v.reshape(grid)) for k, v in results.items())
+        results['losses'] = np.tile(losses, (len(capacities), 1))
+        results.update(self.parameters(capacities, ratings,
+                                       results['throughput'],
+                                       results['losses']))
+        return Sweep(self.gateway, capacities, ratings, results)
+
+    def ensemble(self, demand, times, hours=1.):
+        """Simulate realizations of the demand of the load.
+
+        The system is not simulated or changed.  Generation is calculated
+        once and every realization starts with full storage.
+
+        Args:
+            demand (ndarray): Wh of an hour of each realization and step,
+                e.g. from loads.ensemble.
+            times (list): datetime of each step.
+            hours (float or array_like): hours per step, or of each step.
+
+        Returns:
+            (dict) arrays of shortfall (Wh), lolh (hours), outages (n),
+            throughput (Wh), surplus (Wh) and state (Wh) of each
+            realization.
+        """
+        demand = np.atleast_2d(np.asarray(demand, dtype=float))
+        weather = self.gateway.context.weather
+        weather = weather.take(weather.rows(times))
+        step_hours = step_lengths(hours, len(times))
+        vi = [pv.output_series(weather) for pv in self.plant.children]
+        generation = self.plant.convert(vi)[0]
+        capacity = np.repeat(float(self.storage.nominal_capacity),
+                             len(demand))
+        return self.settle(demand * step_hours, generation * step_hours,
+                           capacity, step_hours)
+
+    def parameters(self, capacities, ratings, throughput, losses):
+        """Parameters of gateway for each capacity and PV rating.
+
+        Returns:
+            (dict) arrays of cost, co2, tox, area, depletion, emissions and
+            losses.
+        """
+        gateway = self.gateway
+        storage = self.storage
+        plant = self.plant
+        module = plant.children[0]
+        names = ('cost', 'co2', 'tox', 'area', 'depletion', 'emissions',
+                 'losses')
+        results = dict((name, np.empty(throughput.shape)) for name in names)
+        saved = (storage.nominal_capacity, storage.throughput, module.stc,
+                 plant.loss)
+        try:
+            for i, capacity in enumerate(capacities):
+                for j, rating in enumerate(ratings):
+                    storage.nominal_capacity = capacity
+                    storage.throughput = throughput[i, j]
+                    module.stc = rating
+                    plant.loss = losses[i, j]
+                    for name in names:
+                        results[name][i, j] = gateway.parameter(name)
+        finally:
+            (storage.nominal_capacity, storage.throughput, module.stc,
+             plant.loss) = saved
+        return results
+
+
+def step_lengths(hours, n):
+    """Hours of each of n steps.
+
+    Args:
+        hours (float or array_like): hours per step, or of each step.
+        n (int): steps.
+
+    Returns:
+        (ndarray)
+    """
+    step_hours = np.empty(n)
+    step_hours[:] = hours
+    return step_hours
+
+
+def run(gateway, times, hours=1.):
+    """Simulate gateway over times.
+
+    Single domain systems are simulated by SingleDomain, other systems are
+    called step by step.
+
+    Args:
+        gateway (Gateway): top gateway of system.
+        times (list): datetime of each step.
+        hours (float or array_like): hours per step, or of each step.
+    """
+    system = SingleDomain.detect(gateway)
+    if system is not None:
+        system.run(times, hours)
+        return
+    context = gateway.context
+    for dt, h in zip(times, step_lengths(hours, len(times)).tolist()):
+        context.update_time(dt, h)
+        gateway(h)
+
+
+class SweepPoint(object):
+
+    """Results of one system of a Sweep.
+
+    Has the methods of a Gateway that merit classes use.
+
+    Attributes:
+        capacity (float): storage capacity (Wh).
+        rating (float): PV STC rating (W).
+        shortfall (float): energy shortfall (Wh).
+        lolh (float): loss of load hours.
+        outages (int): steps with a shortfall.
+    """
+
+    def __init__(self, sweep, i, j):
+        self.capacity = sweep.capacities[i]
+        self.rating = sweep.ratings[j]
+        self.domain_r = sweep.gateway.domain_r
+        self.results = dict((k, v[i, j].item())
+                            for k, v in sweep.results.items())
+        self.shortfall = self.results['shortfall']
+        self.lolh = self.results['lolh']
+        self.outages = self.results['outages']
+
+    def parameter(self, name):
+        return self.results[name]
+
+    def cost(self):
+        return self.results['cost']
+
+    def co2(self):
+        return self.results['co2']
+
+    def tox(self):
+        return self.results['tox']
+
+    def area(self):
+        return self.results['area']
+
+    def depletion(self):
+        return self.results['depletion']
+
+    def surplus(self):
+        return self.results['surplus']
+
+    def rvalue(self):
+        return self.shortfall * self.domain_r
+
+    def STC(self):
+        return self.rating
+
+    def __repr__(self):
+        return 'Sweep %s Wh, %s W' % (self.capacity, self.rating)
+
+
+class Sweep(object):
+
+    """Results of a sweep of storage capacities and PV ratings.
+
+    Results are arrays indexed by capacity then rating.
+
+    Attributes:
+        gateway (Gateway): system swept.
+        capacities (ndarray): storage capacities (Wh).
+        ratings (ndarray): PV STC ratings (W).
+        results (dict): arrays of shortfall, lolh, outages, throughput,
+            surplus, state, cost, co2, tox, area, depletion, emissions and
+            losses.
+    """
+
+    def __init__(self, gateway, capacities, ratings, results):
+        self.gateway = gateway
+        self.capacities = capacities
+        self.ratings = ratings
+        self.results = results
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def point(self, i, j):
+        """Returns: (SweepPoint) of capacity i and rating j."""
+        return SweepPoint(self, i, j)
+
+    def merit(self, merit=None):
+        """Merit of every system.
+
+        Args:
+            merit (object): merit calculation (default merit of gateway).
+
+        Returns:
+            (ndarray) merit indexed by capacity then rating.
+        """
+        if merit is None:
+            merit = self.gateway.system_merit
+        grid = np.empty((len(self.capacities), len(self.ratings)))
+        for i in range(len(self.capacities)):
+            for j in range(len(self.ratings)):
+                grid[i, j] = merit(self.point(i, j))
+        return grid
+
+    def best(self, merit=None):
+        """Returns: (SweepPoint) with smallest merit."""
+        grid = self.merit(merit)
+        i, j = np.unravel_index(np.nanargmin(grid), grid.shape)
+        return self.point(i, j)
+
+    def __repr__(self):
+        return 'Sweep of %s capacities and %s ratings' % (
+            len(self.capacities), len(self.ratings))
+
+
+def sweep(gateway, capacities, ratings, times, hours=1.):
+    """Simulate a system for every pair of storage capacity and PV rating.
+
+    Args:
+        gateway (Gateway): single domain system with one PV module, it is
+            not simulated or changed.
+        capacities (array_like): storage capacities (Wh).
+        ratings (array_like): PV STC ratings (W).
+        times (list): datetime of each step.
+        hours (float or array_like): hours per step, or of each step.
+
+    Returns:
+        (Sweep)
+    """
+    system = SingleDomain.detect(gateway)
+    if system is None:
+        raise ValueError('%s is not a single domain system' % gateway)
+    return system.sweep(capacities, ratings, times, hours)
+
+
+def ensemble(gateway, demand, times, hours=1.):
+    """Simulate a system for every realization of the demand of its load.
+
+    Args:
+        gateway (Gateway): single domain system, it is not simulated or
+            changed.
+        demand (ndarray): Wh of an hour of each realization and step.
+        times (list): datetime of each step.
+        hours (float or array_like): hours per step, or of each step.
+
+    Returns:
+        (dict) arrays of shortfall (Wh), lolh (hours), outages (n),
+        throughput (Wh), surplus (Wh) and state (Wh) of each realization.
+    """
+    system = SingleDomain.detect(gateway)
+    if system is None:
+        raise ValueError('%s is not a single domain system' % gateway)
+    return system.ensemble(demand, times, hours)
@@ -3,39 +3,139 @@
 # This program is free software. See terms in LICENSE file.
 """Environmental Variables.
 
-Environment holds weather and global variables in shared memory.
+A SimulationContext holds the weather, clock and ID counters of a single
+simulation.  Devices read the context they are bound to, devices that are not
+bound read the current context of their thread.  The current context is a
+shared default context unless another context has been entered using a with
+statement, so several independent simulations can run in one process.
+
+>>> context = SimulationContext()
+>>> with context:
+...     current() is context
+True
+>>> current() is DEFAULT
+True
+
+The module level functions operate on the current context.
 
 Attributes:
-    weather (dict): all availible weather data.
-    time (datetime): current time in environment.
-    time_series (list): history of time.
+    DEFAULT (SimulationContext): context used when no other is current.
 
 """
 import os
+import threading
+from misc import Counter
+from weather import WeatherStore
+
 SRC_PATH = os.path.dirname(os.path.abspath(__file__))
 
-weather = {}
-time = None
-time_series = []
-network = None
-total_time = 0.  # hours
+_LOCAL = threading.local()
+
+
+class SimulationContext(object):
+
+    """Simulation state.
+
+    Attributes:
+        weather (WeatherStore): all availible weather data.
+        row (int): weather row of current time.
+        step (int): index of current time step, starting at 0.
+        time (datetime): current time in simulation.
+        time_series (list): history of time, datetime of each step.
+        total_time (float): hours simulated.
+        timestep (float): hours of current step.
+        ids (Counter): small ID counters of devices.
+
+    """
+
+    def __init__(self, weather=None):
+        """Initialize.
+
+        Args:
+            weather (WeatherStore or iterable): weather data, a store may be
+                shared between contexts as it is read only.
+        """
+        self.weather = None
+        if weather is not None:
+            self.set_weather(weather)
+        self.ids = Counter()
+        self.reset()
+
+    def set_weather(self, iterable):
+        """Set weather.
+
+        Args:
+            iterable (WeatherStore or iterable): records are parsed into a
+                WeatherStore.
+        """
+        if not isinstance(iterable, WeatherStore):
+            iterable = WeatherStore.from_records(iterable)
+        self.weather = iterable
+
+    def update_time(self, dt, hours=1.):
+        """Update simulation time.
+
+        Args:
+            dt (datetime): time of step.
+            hours (float): length of step, steps need not be of equal length.
+        """
+        self.total_time += hours
+        self.timestep = hours
+        self.time_series.append(dt)
+        self.time = dt
+        self.step += 1
+        if self.weather is not None:
+            self.row = self.weather.index(dt)
+
+    def record(self):
+        """Returns: (WeatherRecord) weather at current time."""
+        return self.weather.record(self.row)
+
+    def steps_per_day(self):
+        """Returns: (int) steps in a day at the current time step."""
+        return int(round(24. / self.timestep))
+
+    def reset(self):
+        self.step = -1
+        self.row = None
+        self.time = None
+        self.time_series = []
+        self.total_time = 0.  # hours
+        self.timestep = 1.  # hours
+
+    def __enter__(self):
+        if not hasattr(_LOCAL, 'stack'):
+            _LOCAL.stack = []
+        _LOCAL.stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _LOCAL.stack.pop()
+
+
+DEFAULT = SimulationContext()
+
+
+def current():
+    """Current context of thread.
+
+    Returns:
+        (SimulationContext)
+    """
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack:
+        return stack[-1]
+    return DEFAULT
+
 
 def set_weather(iterable):
-    for i, r in enumerate(iterable):
-        weather[r['datetime']] = r
+    current().set_weather(iterable)
+
 
 def update_time(dt, hours=1.):
-    """Update global simulation time."""
-    global time
-    global total_time
-    total_time += hours
-    time_series.append(dt)
-    time = dt
+    """Update current simulation time."""
+    current().update_time(dt, hours)
+
 
 def reset():
-    global time_series
-    global network
-    global total_time
-    time_series = []
-    network = None
-    total_time = 0
+    current().reset()
@@ -0,0 +1,375 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Plane of array irradiance.
+
+Irradiance of a plane at every row of a weather store is calculated once and
+shared by every plane with the same orientation at the same site.  Results
+are kept for the life of the process and cached as binary files in
+CACHE_PATH, keyed by site, tilt, azimuth, transposition model and the
+contents of the weather, so optimizations that build new planes for every
+evaluation calculate irradiance once per location.
+
+The p9 model, Perez 1990, is calculated for every row at once from the
+weather columns.  Solar position and the components of irradiance that do
+not depend on orientation are calculated once for each site as array
+operations, planes are projected from them with matrix products, so a year
+for one plane takes milliseconds and a grid of orientations is little more.
+Other models of solpy are calculated one row at a time, as is per_row, which
+can be used to compare results with solpy.
+
+The sun is placed at the middle of the step ending at each row, as solpy
+does for hourly weather, and a horizontal plane receives the global
+horizontal irradiance.  Over a clear day at Dhaka a plane tilted 24 degrees
+to the south receives within 2% of the irradiance solpy calculates.
+
+>>> import datetime
+>>> from weather import WeatherStore
+>>> place = (23.7, 90.4)
+>>> hours = [datetime.datetime(2013, 6, 21, h) for h in range(24)]
+>>> middle = np.array(hours, dtype='datetime64[s]') - np.timedelta64(30, 'm')
+>>> zenith = solar_position(place, middle)[0]
+>>> cos_z = np.maximum(np.cos(np.radians(zenith)), 0.)
+>>> weather = WeatherStore.from_records(
+...     [{'datetime': t, 'utc_datetime': t, 'GHI (W/m^2)': 700*c + 100*(c > 0),
+...       'DNI (W/m^2)': 700*(c > 0), 'DHI (W/m^2)': 100*(c > 0)}
+...      for t, c in zip(hours, cos_z)])
+>>> bool((transpose(place, 0, 180, weather) == weather['GHI (W/m^2)']).all())
+True
+>>> south = transpose(place, 24, 180, weather).sum()
+>>> abs(south/per_row(place, 24, 180, weather).sum() - 1.) < .02
+True
+
+A grid of orientations holds the irradiance of each plane.
+
+>>> grid = components(place, weather).grid([0, 24, 45], [90, 180, 270])
+>>> grid.shape
+(3, 3, 24)
+>>> bool(np.allclose(grid[1, 2], transpose(place, 24, 270, weather)))
+True
+
+"""
+import hashlib
+import os
+import numpy as np
+
+from weather import CACHE_PATH
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 3
+ALBEDO = .2
+SOLAR_CONSTANT = 1367.  # W/m^2
+
+# Perez 1990 coefficients f11, f12, f13, f21, f22, f23 of each bin of sky
+# clearness
+PEREZ = np.array([[-0.008, 0.588, -0.062, -0.060, 0.072, -0.022],
+                  [0.130, 0.683, -0.151, -0.019, 0.066, -0.029],
+                  [0.330, 0.487, -0.221, 0.055, -0.064, -0.026],
+                  [0.568, 0.187, -0.295, 0.109, -0.152, -0.014],
+                  [0.873, -0.392, -0.362, 0.226, -0.462, 0.001],
+                  [1.132, -1.237, -0.412, 0.288, -0.823, 0.056],
+                  [1.060, -1.600, -0.359, 0.264, -1.127, 0.131],
+                  [0.678, -0.327, -0.250, 0.156, -1.377, 0.251]])
+PEREZ_BINS = np.array([1.065, 1.23, 1.5, 1.95, 2.8, 4.5, 6.2])
+
+_POA = {}
+_COMPONENTS = {}
+
+
+def cache_key(place, tilt, azimuth, weather, model='p9'):
+    """Key of irradiance of a plane.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        tilt (float): degrees array tilt.
+        azimuth (float): degrees array azimuth.
+        weather (WeatherStore)
+        model (str): transposition model.
+
+    Returns:
+        (tuple)
+    """
+    return (round(float(place[0]), 6), round(float(place[1]), 6),
+            float(tilt), float(azimuth), weather.fingerprint(), model)
+
+
+def poa(place, tilt, azimuth, weather, model='p9'):
+    """Irradiance of a plane at every row of weather.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        tilt (float): degrees array tilt.
+        azimuth (float): degrees array azimuth.
+        weather (WeatherStore)
+        model (str): transposition model.
+
+    Returns:
+        (ndarray) read only W/m^2 of each row.
+    """
+    key = cache_key(place, tilt, azimuth, weather, model)
+    values = _POA.get(key)
+    if values is not None:
+        return values
+    filename = os.path.join(CACHE_PATH, 'poa_%s_v%s.npy' % (
+        hashlib.sha1(repr(key)).hexdigest(), CACHE_VERSION))
+    if os.path.exists(filename):
+        values = np.load(filename)
+    else:
+        values = _transpose(place, tilt, azimuth, weather, model)
+        try:
+            if not os.path.isdir(CACHE_PATH):
+                os.makedirs(CACHE_PATH)
+            # write then rename so other processes never read a partial file
+            temp = '%s.%s.tmp' % (filename, os.getpid())
+            with open(temp, 'wb') as f:
+                np.save(f, values)
+            os.rename(temp, filename)
+        except (IOError, OSError) as e:
+            logger.debug('Irradiance not cached: %s', e)
+    values.flags.writeable = False
+    _POA[key] = values
+    return values
+
+
+def solar_position(place, times):
+    """Position of the sun.
+
+    A low precision ephemeris, within about a hundredth of a degree from
+    1950 to 2050, without refraction.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        times (ndarray): UTC datetime64 of each row.
+
+    Returns:
+        (tuple) arrays of zenith and azimuth, east of north, in degrees and
+        extraterrestrial normal irradiance in W/m^2.
+    """
+    seconds = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+    n = (seconds - 946728000) / 86400.  # days from J2000.0
+    mean_longitude = np.radians((280.460 + 0.9856474*n) % 360.)
+    anomaly = np.radians((357.528 + 0.9856003*n) % 360.)
+    longitude = mean_longitude + np.radians(1.915*np.sin(anomaly) +
+                                            0.020*np.sin(2*anomaly))
+    obliquity = np.radians(23.439 - 0.0000004*n)
+    ascension = np.arctan2(np.cos(obliquity)*np.sin(longitude),
+                           np.cos(longitude))
+    declination = np.arcsin(np.sin(obliquity)*np.sin(longitude))
+    sidereal = np.radians((280.46061837 + 360.98564736629*n +
+                           place[1]) % 360.)
+    hour_angle = sidereal - ascension
+    lat = np.radians(place[0])
+    cos_zenith = (np.sin(lat)*np.sin(declination) +
+                  np.cos(lat)*np.cos(declination)*np.cos(hour_angle))
+    zenith = np.degrees(np.arccos(np.clip(cos_zenith, -1., 1.)))
+    azimuth = np.degrees(np.arctan2(
+        -np.cos(declination)*np.sin(hour_angle),
+        np.sin(declination)*np.cos(lat) -
+        np.cos(declination)*np.sin(lat)*np.cos(hour_angle))) % 360.
+    extraterrestrial = SOLAR_CONSTANT*(1. + 0.033*np.cos(
+        2*np.pi*n/365.25))
+    return zenith, azimuth, extraterrestrial
+
+
+def _perez_coefficients(zenith, dni, dhi, extraterrestrial):
+    """Circumsolar and horizon brightening coefficients F1 and F2."""
+    z = np.radians(zenith)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kz3 = 1.041*z**3
+        clearness = ((dhi + dni)/dhi + kz3)/(1. + kz3)
+        air_mass = 1./(np.cos(z) + 0.50572*(96.07995 - zenith)**-1.6364)
+        brightness = dhi*air_mass/extraterrestrial
+    f = PEREZ[np.searchsorted(PEREZ_BINS, np.nan_to_num(clearness),
+                              side='right')].T
+    f1 = np.maximum(f[0] + f[1]*brightness + f[2]*z, 0.)
+    f2 = f[3] + f[4]*brightness + f[5]*z
+    return f1, f2
+
+
+def _half_steps(times):
+    """Half the step ending at each time, steps of an hour for one time."""
+    seconds = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+    steps = np.empty(len(seconds), dtype=np.int64)
+    steps.fill(3600)
+    if len(seconds) > 1:
+        steps[1:] = np.diff(seconds)
+        steps[0] = steps[1]
+    return (steps // 2).astype('timedelta64[s]')
+
+
+def _sun(zenith, azimuth):
+    """Unit vectors up, north and east toward the sun, a column per row."""
+    z = np.radians(zenith)
+    phi = np.radians(azimuth)
+    return np.array([np.cos(z), np.sin(z)*np.cos(phi), np.sin(z)*np.sin(phi)])
+
+
+def normals(tilts, azimuths):
+    """Unit vectors up, north and east normal to planes, a row per plane.
+
+    Args:
+        tilts, azimuths (array_like): degrees of each plane.
+
+    Returns:
+        (ndarray)
+    """
+    beta = np.radians(np.asarray(tilts, dtype=float))
+    gamma = np.radians(np.asarray(azimuths, dtype=float))
+    return np.array([np.cos(beta), np.sin(beta)*np.cos(gamma),
+                     np.sin(beta)*np.sin(gamma)]).T
+
+
+class Components(object):
+
+    """Irradiance of a site that does not depend on orientation, Perez 1990.
+
+    Irradiance of a plane is the direct component times the cosine of the
+    angle of incidence, clipped at zero, plus the diffuse components times
+    1, cos(tilt) and sin(tilt).  Both are matrix products with the plane
+    normals, so planes of any orientation are projected from components
+    calculated once.  Weather of a row is measured over the step ending at
+    it, the sun is placed at the middle of the step.  Diffuse irradiance
+    counts in steps the sun rises or sets in, even when the sun is below the
+    horizon at the middle.
+
+    Attributes:
+        ghi (ndarray): W/m^2 global horizontal irradiance of each row.
+        sun (ndarray): unit vectors up, north and east toward the sun, a
+            column per row.
+        direct (ndarray): W/m^2 beam and circumsolar irradiance of each row.
+        diffuse (ndarray): W/m^2 coefficients of 1, cos(tilt) and sin(tilt),
+            a column per row, of isotropic sky, horizon and ground reflected
+            irradiance.
+    """
+
+    def __init__(self, place, weather, albedo=ALBEDO):
+        """Initialize.
+
+        Args:
+            place (tuple): lat, lon geolocation.
+            weather (WeatherStore): with GHI, DNI and DHI (W/m^2) fields.
+            albedo (float): ground reflectance.
+        """
+        field = 'utc_datetime' if 'utc_datetime' in weather.columns \
+            else 'datetime'
+        times = np.asarray(weather[field], dtype='datetime64[s]')
+        zenith, sun_azimuth, extraterrestrial = solar_position(
+            place, times - _half_steps(times))
+        ghi = np.asarray(weather['GHI (W/m^2)'], dtype=float)
+        dni = np.asarray(weather['DNI (W/m^2)'], dtype=float)
+        dhi = np.asarray(weather['DHI (W/m^2)'], dtype=float)
+        up = zenith < 90.
+        sky = up & (dhi > 0)
+        f1, f2 = _perez_coefficients(zenith, dni, dhi, extraterrestrial)
+        f1 = np.where(sky, f1, 0.)
+        f2 = np.where(sky, f2, 0.)
+        b = np.maximum(np.cos(np.radians(zenith)), np.cos(np.radians(85.)))
+        isotropic = dhi*(1. - f1)/2.
+        reflected = ghi*albedo/2.
+        self.ghi = ghi
+        self.sun = _sun(zenith, sun_azimuth)
+        self.direct = np.where(up, dni + dhi*f1/b, 0.)
+        self.diffuse = np.array([isotropic + reflected,
+                                 isotropic - reflected, dhi*f2])
+
+    def poa(self, tilts, azimuths):
+        """Irradiance of planes.
+
+        Args:
+            tilts, azimuths (array_like): degrees of each plane.
+
+        Returns:
+            (ndarray) W/m^2, a row of weather rows for each plane.
+        """
+        n = normals(tilts, azimuths)
+        beta = np.radians(np.asarray(tilts, dtype=float))
+        trig = np.array([np.ones_like(beta), np.cos(beta), np.sin(beta)]).T
+        values = (np.maximum(n.dot(self.sun), 0.)*self.direct +
+                  trig.dot(self.diffuse))
+        values[beta == 0.] = self.ghi
+        return values
+
+    def grid(self, tilts, azimuths):
+        """Irradiance of every pair of tilt and azimuth.
+
+        Args:
+            tilts, azimuths (array_like): degrees.
+
+        Returns:
+            (ndarray) W/m^2 of each tilt, azimuth and weather row.
+        """
+        t, a = np.meshgrid(tilts, azimuths, indexing='ij')
+        return self.poa(t.ravel(), a.ravel()).reshape(t.shape + (-1,))
+
+
+def components(place, weather, albedo=ALBEDO):
+    """Components of a site, calculated once for each site and weather.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        weather (WeatherStore)
+        albedo (float): ground reflectance.
+
+    Returns:
+        (Components)
+    """
+    key = (round(float(place[0]), 6), round(float(place[1]), 6),
+           weather.fingerprint(), float(albedo))
+    found = _COMPONENTS.get(key)
+    if found is None:
+        found = _COMPONENTS[key] = Components(place, weather, albedo)
+    return found
+
+
+def transpose(place, tilt, azimuth, weather, albedo=ALBEDO):
+    """Irradiance of a plane at every row of weather, Perez 1990.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        tilt (float): degrees array tilt.
+        azimuth (float): degrees array azimuth.
+        weather (WeatherStore): with GHI, DNI and DHI (W/m^2) fields.
+        albedo (float): ground reflectance.
+
+    Returns:
+        (ndarray) W/m^2 of each row.
+    """
+    return components(place, weather, albedo).poa([tilt], [azimuth])[0]
+
+
+NATIVE = {'p9': transpose}
+
+
+def _transpose(place, tilt, azimuth, weather, model):
+    """Irradiance of a plane, natively if model has an array version."""
+    if model in NATIVE:
+        return NATIVE[model](place, tilt, azimuth, weather)
+    return per_row(place, tilt, azimuth, weather, model)
+
+
+def per_row(place, tilt, azimuth, weather, model='p9'):
+    """Irradiance of a plane calculated by solpy one row at a time.
+
+    Args:
+        place (tuple): lat, lon geolocation.
+        tilt (float): degrees array tilt.
+        azimuth (float): degrees array azimuth.
+        weather (WeatherStore)
+        model (str): solpy transposition model.
+
+    Returns:
+        (ndarray) W/m^2 of each row, 0 at rows solpy cannot calculate.
+    """
+    from solpy import irradiation
+    values = np.empty(len(weather))
+    for i, record in enumerate(weather):
+        try:
+            values[i] = irradiation.irradiation(record, place, t=tilt,
+                                                array_azimuth=azimuth,
+                                                model=model)
+        except Exception as e:
+            logger.warning('No irradiance at row %s: %s', i, e)
+            values[i] = 0.
+    return values
@@ -0,0 +1,505 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Step indexed records.
+
+Devices record values by the integer step of the simulation clock into
+preallocated arrays rather than dicts keyed by datetime.  A Series holds a
+single record, a Ledger holds several records of the same steps as columns
+of one array.
+
+Records of long runs can retain only a window of recent steps.  Older steps
+are no longer held, a single step reads as fill, values of a run of steps
+that includes them raise IndexError, but sum and mean still include them.
+
+>>> s = Series()
+>>> s[2] = 4.
+>>> s[2] += 1.
+>>> s[2], len(s), 1 in s, 2 in s
+(5.0, 3, False, True)
+>>> s.sum()
+5.0
+>>> s.put(3, [1., 2.])
+>>> s.values(2).tolist()
+[5.0, 1.0, 2.0]
+
+>>> ledger = Ledger(['credits', 'debits'])
+>>> ledger['credits'][1] = 2.
+>>> ledger['debits'][1] -= 2.
+>>> ledger.values('credits').tolist(), ledger['debits'].sum()
+([0.0, 2.0], -2.0)
+
+>>> s = Series()
+>>> s.retain(2)
+>>> for step in range(4):
+...     s[step] = step + 1.
+>>> s[1], s[3], s.sum(), s.values(2).tolist()
+(nan, 4.0, 10.0, [3.0, 4.0])
+>>> s.values()
+Traceback (most recent call last):
+    ...
+IndexError: steps before 2 are no longer retained
+
+"""
+import numpy as np
+
+CHUNK = 24 * 365  # steps allocated at a time
+
+
+def whole(history):
+    """History of every step of a run.
+
+    Args:
+        history (list or deque): values appended once per step or event.
+
+    Returns:
+        (list or deque) history.
+
+    Raises:
+        IndexError: if history is bounded, holding only recent values.
+    """
+    if getattr(history, 'maxlen', None) is not None:
+        raise IndexError('only the last %s values are retained' %
+                         history.maxlen)
+    return history
+
+
+def _evict(data, fill, n, stop, window, retired, counts):
+    """Retire steps older than window before stop from ring data.
+
+    Args:
+        data (ndarray): ring of window steps in the last axis.
+        fill (float): value of steps not recorded.
+        n (int): last recorded step + 1.
+        stop (int): new last recorded step + 1.
+        window (int): steps retained.
+        retired (ndarray): sums of retired values, updated in place.
+        counts (ndarray): counts of retired values, updated in place.
+    """
+    for step in range(max(n - window, 0), min(n, stop - window)):
+        slot = step % window
+        value = data[..., slot]
+        recorded = value == value
+        retired += np.where(recorded, value, 0.)
+        counts += recorded
+        data[..., slot] = fill
+    skipped = stop - window - n  # steps never recorded
+    if skipped > 0 and fill == fill:
+        retired += skipped * fill
+        counts += skipped
+
+
+def _window_values(ring, fill, n, window, start, stop):
+    """Values of steps from start to stop of a ring of window steps.
+
+    Raises:
+        IndexError: if steps from start to stop are no longer retained.
+    """
+    if start < min(stop, n - window):
+        raise IndexError('steps before %s are no longer retained' %
+                         (n - window))
+    values = np.empty(stop - start)
+    values.fill(fill)
+    low = max(start, n - window, 0)
+    high = min(stop, n)
+    if low < high:
+        values[low - start:high - start] = ring[np.arange(low, high) % window]
+    return values
+
+
+class Series(object):
+
+    """Float values indexed by simulation step.
+
+    Steps that have not been recorded read as fill.  NaN fill marks values
+    that have not been computed yet.
+
+    Attributes:
+        fill (float): value of steps not recorded.
+        data (ndarray): allocated values.
+        n (int): last recorded step + 1.
+    """
+
+    def __init__(self, fill=np.nan, size=CHUNK):
+        """Initialize.
+
+        Args:
+            fill (float): value of steps not recorded (default NaN).
+            size (int): steps to allocate on first write.
+        """
+        self.fill = fill
+        self.size = size
+        self.data = None
+        self.n = 0
+        self.window = None
+
+    def retain(self, window):
+        """Hold only the last window steps from now on.
+
+        Args:
+            window (int): steps retained.
+        """
+        if self.window is not None:
+            raise ValueError('%s already retains %s steps' % (self,
+                                                               self.window))
+        values = self.values()
+        low = max(self.n - window, 0)
+        old = values[:low]
+        self.retired = np.array(np.nansum(old))
+        self.counts = np.array(np.count_nonzero(old == old))
+        ring = np.empty(window)
+        ring.fill(self.fill)
+        ring[np.arange(low, self.n) % window] = values[low:]
+        self.data = ring
+        self.window = window
+
+    def reserve(self, steps):
+        """Allocate at least steps, growing by doubling."""
+        if self.window is not None:
+            return
+        if self.data is None:
+            self.data = np.empty(max(self.size, steps))
+            self.data.fill(self.fill)
+        elif steps > len(self.data):
+            data = np.empty(max(2 * len(self.data), steps))
+            data.fill(self.fill)
+            data[:len(self.data)] = self.data
+            self.data = data
+
+    def __getitem__(self, step):
+        if step >= self.n:
+            return self.fill
+        if self.window is None:
+            return self.data.item(step)
+        if step < self.n - self.window:
+            return self.fill
+        return self.data.item(step % self.window)
+
+    def __setitem__(self, step, value):
+        if self.window is not None:
+            if step >= self.n:
+                _evict(self.data, self.fill, self.n, step + 1, self.window,
+                       self.retired, self.counts)
+                self.n = step + 1
+            elif step < self.n - self.window:
+                raise IndexError('step %s is no longer retained' % step)
+            self.data.itemset(step % self.window, value)
+            return
+        if step >= self.n:
+            if self.data is None or step >= len(self.data):
+                self.reserve(step + 1)
+            self.n = step + 1
+        self.data.itemset(step, value)
+
+    def put(self, start, values):
+        """Record values of a run of steps.
+
+        Args:
+            start (int): step of first value.
+            values (array_like): one value per step.
+        """
+        if self.window is not None:
+            for step, value in enumerate(values, start):
+                self[step] = value
+            return
+        stop = start + len(values)
+        self.reserve(stop)
+        self.data[start:stop] = values
+        self.n = max(self.n, stop)
+
+    def __contains__(self, step):
+        value = self[step]
+        return value == value and value != self.fill
+
+    def __len__(self):
+        return self.n
+
+    def values(self, start=0, stop=None):
+        """Recorded values.
+
+        Returns:
+            (ndarray) view of values from start to stop (default last step),
+            a copy if only a window of steps is retained.
+        """
+        if stop is None:
+            stop = self.n
+        if self.window is not None:
+            return _window_values(self.data, self.fill, self.n, self.window,
+                                  start, stop)
+        if self.data is None or stop > len(self.data):
+            self.reserve(stop)
+        return self.data[start:stop]
+
+    def retained(self):
+        """Returns: (ndarray) values of steps still held."""
+        if self.window is None:
+            return self.values()
+        return self.values(max(self.n - self.window, 0))
+
+    def sum(self):
+        """Returns: (float) sum of recorded values, ignoring NaN."""
+        if self.window is None:
+            return float(np.nansum(self.values()))
+        return float(self.retired + np.nansum(self.retained()))
+
+    def mean(self):
+        """Returns: (float) mean of recorded values, ignoring NaN."""
+        if self.window is None:
+            return float(np.nanmean(self.values()))
+        values = self.retained()
+        count = self.counts + np.count_nonzero(values == values)
+        return float(self.sum() / count) if count else np.nan
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.window is None and self.data is not None:
+            state['data'] = self.data[:self.n]  # unused capacity is not kept
+        return state
+
+    def __repr__(self):
+        return 'Series %s steps' % self.n
+
+
+class Ledger(object):
+
+    """Float columns indexed by simulation step.
+
+    Columns are rows of a single array that grows a chunk of steps at a time.
+    Steps that have not been recorded read as fill.
+
+    Attributes:
+        names (tuple): column names.
+        fill (float): value of steps not recorded.
+        data (ndarray): allocated values, one row per column.
+        n (int): last recorded step + 1.
+    """
+
+    def __init__(self, names, fill=0., size=CHUNK):
+        """Initialize.
+
+        Args:
+            names (list): column names.
+            fill (float): value of steps not recorded (default 0).
+            size (int): steps allocated at a time.
+        """
+        self.names = tuple(names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.fill = fill
+        self.size = size
+        self.data = None
+        self.n = 0
+        self.window = None
+        self.columns = dict((name, Column(self, i))
+                            for i, name in enumerate(self.names))
+
+    def retain(self, window):
+        """Hold only the last window steps from now on.
+
+        Args:
+            window (int): steps retained.
+        """
+        if self.window is not None:
+            raise ValueError('%s already retains %s steps' % (self,
+                                                               self.window))
+        self.reserve(self.n)
+        values = self.data[:, :self.n]
+        low = max(self.n - window, 0)
+        old = values[:, :low]
+        self.retired = np.nansum(old, axis=1)
+        self.counts = np.count_nonzero(old == old, axis=1)
+        ring = np.empty((len(self.names), window))
+        ring.fill(self.fill)
+        ring[:, np.arange(low, self.n) % window] = values[:, low:]
+        self.data = ring
+        self.window = window
+
+    def reserve(self, steps):
+        """Allocate at least steps, growing by whole chunks."""
+        if self.window is not None:
+            return
+        allocated = 0 if self.data is None else self.data.shape[1]
+        if self.data is None or steps > allocated:
+            chunks = max(1, -(-(steps - allocated) // self.size))
+            data = np.empty((len(self.names), allocated + chunks * self.size))
+            data.fill(self.fill)
+            if allocated:
+                data[:, :allocated] = self.data
+            self.data = data
+
+    def record(self, step):
+        """Mark step as recorded."""
+        if step >= self.n:
+            if self.window is not None:
+                _evict(self.data, self.fill, self.n, step + 1, self.window,
+                       self.retired, self.counts)
+            elif self.data is None or step >= self.data.shape[1]:
+                self.reserve(step + 1)
+            self.n = step + 1
+
+    def slot(self, step):
+        """Returns: (int) index of step in data."""
+        if self.window is None:
+            return step
+        if step < self.n - self.window:
+            raise IndexError('step %s is no longer retained' % step)
+        return step % self.window
+
+    def values(self, name, start=0, stop=None):
+        """Recorded values of column.
+
+        Returns:
+            (ndarray) view of values from start to stop (default last step),
+            a copy if only a window of steps is retained.
+        """
+        if stop is None:
+            stop = self.n
+        row = self.index[name]
+        if self.window is not None:
+            return _window_values(self.data[row], self.fill, self.n,
+                                  self.window, start, stop)
+        self.reserve(stop)
+        return self.data[row, start:stop]
+
+    def sum(self, name):
+        """Returns: (float) sum of recorded values of column, ignoring NaN."""
+        if self.window is None:
+            return float(np.nansum(self.values(name)))
+        start = max(self.n - self.window, 0)
+        row = self.index[name]
+        return float(self.retired[row] +
+                     np.nansum(self.values(name, start)))
+
+    def mean(self, name):
+        """Returns: (float) mean of recorded values of column, ignoring NaN."""
+        if self.window is None:
+            return float(np.nanmean(self.values(name)))
+        values = self.values(name, max(self.n - self.window, 0))
+        count = self.counts[self.index[name]] + \
+            np.count_nonzero(values == values)
+        return float(self.sum(name) / count) if count else np.nan
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.n
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.window is None and self.data is not None:
+            # unused capacity is not kept
+            state['data'] = self.data[:, :self.n]
+        return state
+
+    def __repr__(self):
+        return 'Ledger %s steps of %s' % (self.n, ', '.join(self.names))
+
+
+class Column(object):
+
+    """Column of a Ledger, used like a Series."""
+
+    __slots__ = ('ledger', 'row')
+
+    def __init__(self, ledger, row):
+        self.ledger = ledger
+        self.row = row
+
+    def __getitem__(self, step):
+        ledger = self.ledger
+        if step >= ledger.n:
+            return ledger.fill
+        if ledger.window is not None:
+            if step < ledger.n - ledger.window:
+                return ledger.fill
+            step = step % ledger.window
+        return ledger.data.item(self.row, step)
+
+    def __setitem__(self, step, value):
+        ledger = self.ledger
+        if step >= ledger.n:
+            ledger.record(step)
+        if ledger.window is not None:
+            step = ledger.slot(step)
+        ledger.data.itemset((self.row, step), value)
+
+    def __contains__(self, step):
+        value = self[step]
+        return value == value and value != self.ledger.fill
+
+    def __len__(self):
+        return self.ledger.n
+
+    def put(self, start, values):
+        """Record values of a run of steps."""
+        ledger = self.ledger
+        if ledger.window is not None:
+            for step, value in enumerate(values, start):
+                self[step] = value
+            return
+        ledger.record(start + len(values) - 1)
+        ledger.data[self.row, start:start + len(values)] = values
+
+    def values(self, start=0, stop=None):
+        """Returns: (ndarray) view of values from start to stop."""
+        return self.ledger.values(self.ledger.names[self.row], start, stop)
+
+    def sum(self):
+        """Returns: (float) sum of recorded values, ignoring NaN."""
+        return self.ledger.sum(self.ledger.names[self.row])
+
+    def mean(self):
+        """Returns: (float) mean of recorded values, ignoring NaN."""
+        return self.ledger.mean(self.ledger.names[self.row])
+
+    def __repr__(self):
+        return 'Column %s of %s' % (self.ledger.names[self.row], self.ledger)
+
+
+class RunningStats(object):
+
+    """Count, mean, variance and range of values seen one at a time.
+
+    >>> stats = RunningStats()
+    >>> for value in [1., 2., 3., 4.]:
+    ...     stats.add(value)
+    >>> stats.count, stats.mean, stats.variance(), stats.minimum, stats.maximum
+    (4, 2.5, 1.25, 1.0, 4.0)
+
+    Attributes:
+        count (int): values seen.
+        mean (float): mean of values.
+        minimum (float): smallest value.
+        maximum (float): largest value.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.  # sum of squared differences from the mean
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def add(self, value):
+        """Include value."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def variance(self):
+        """Returns: (float) population variance of values."""
+        if not self.count:
+            return np.nan
+        return self.m2 / self.count
+
+    def std(self):
+        """Returns: (float) population standard deviation of values."""
+        return float(np.sqrt(self.variance()))
+
+    def __repr__(self):
+        return 'RunningStats of %s values' % self.count
@@ -1,23 +1,34 @@
 # Copyright (C) 2015 Nathan Charles
 #
 # This program is free software. See terms in LICENSE file.
-"""Typical Load module with various example loads."""
+"""Typical Load module with various example loads.
+
+The example loads BD, BD_AVE, spline_profile, TV and FLAT are built when
+first used, through the names or bd_example, bd_ave, spline_example,
+tv_example and flat_example, and the Bangladesh load history is parsed once
+and cached as a binary file, so importing the module does no work.
+
+"""
 import environment as env
+import copy
 import csv
 import datetime
+import os
 import numpy as np
 import random
-from scipy.interpolate import interp1d
 from devices import Device
 from econ import Bid
-from misc import Counter
+from ledger import Series, whole
+from weather import CACHE_PATH
 
-SMALL_ID = Counter()
+import logging
+logger = logging.getLogger(__name__)
 
 NEW_YEAR = datetime.datetime(2013, 1, 1)
 hour_to_dt = lambda x: NEW_YEAR + datetime.timedelta(hours=x)
 
 FMT = '%Y-%m-%d %H:%M:%S'
+HISTORY_VERSION = 1
 
 LOAD_PROFILE = [0.645, 0.615, 0.585, 0.569, 0.552, 0.541, 0.53, 0.525, 0.521,
                 0.527, 0.534, 0.557, 0.581, 0.599, 0.617, 0.666, 0.715, 0.744,
@@ -28,21 +39,137 @@ LOAD_PROFILE = [0.645, 0.615, 0.585, 0.569, 0.552, 0.541, 0.53, 0.525, 0.521,
 
 
 def simple_profile(dt, mult=1.):
-    offset = int(round(dt.hour*2.0))
+    offset = int(round((dt.hour + dt.minute/60.)*2.0))
     return LOAD_PROFILE[offset] * mult
 
 
+_HISTORY = {}
+_YEARS = {}
+
+
+def _parse(filename):
+    """Parse daily reports of half hourly load.
+
+    Returns:
+        (tuple) array of a row of 48 half hours for each day from the first
+        day reported, NaN on days not reported, and ordinal of first day.
+    """
+    days = {}
+    for i in csv.reader(open(filename)):
+        lp = [float(j.strip()) for j in i[2:50]]
+        tdt = datetime.datetime.strptime(i[0][0:19], FMT).toordinal()
+        days[tdt] = lp  # later reports of a day replace earlier ones
+    first = min(days)
+    data = np.empty((max(days) - first + 1, 48))
+    data.fill(np.nan)
+    for day, lp in days.items():
+        data[day - first] = lp
+    return data, first
+
+
 def _load(filename=None):
-    BD = {}
+    """Load history, parsed once and cached in CACHE_PATH.
+
+    Args:
+        filename (str): CSV of daily reports (default Bangladesh history).
+
+    Returns:
+        (tuple) array of half hourly load of each day and ordinal of first
+        day.
+    """
     if filename is None:
         filename = env.SRC_PATH + '/bd_hist_profile.csv'
-    foo = csv.reader(open(filename))
-    for i in foo:
-        lp = [float(j.strip()) for j in i[2:50]]
-        tdt = datetime.datetime.strptime(i[0][0:19], FMT).date()
-        # , len(lp),lp
-        BD[tdt] = lp
-    return BD
+    if filename not in _HISTORY:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        cache = os.path.join(CACHE_PATH, '%s_v%s.npz' % (name,
+                                                         HISTORY_VERSION))
+        if os.path.exists(cache) and \
+                os.path.getmtime(cache) >= os.path.getmtime(filename):
+            stored = np.load(cache)
+            data, first = stored['data'], int(stored['first'])
+            stored.close()
+        else:
+            data, first = _parse(filename)
+            try:
+                if not os.path.isdir(CACHE_PATH):
+                    os.makedirs(CACHE_PATH)
+                # write then rename so other processes never read a partial
+                # file
+                temp = '%s.%s.tmp' % (cache, os.getpid())
+                with open(temp, 'wb') as f:
+                    np.savez(f, data=data, first=first)
+                os.rename(temp, cache)
+            except (IOError, OSError) as e:
+                logger.debug('Load history not cached: %s', e)
+        _HISTORY[filename] = (data, first)
+    return _HISTORY[filename]
+
+
+def _day_index(year):
+    """Row of each day of year in a year of history.
+
+    Returns:
+        (ndarray) row indexed by month and day, -1 for days not in year.
+    """
+    index = -np.ones((13, 32), dtype=int)
+    day = datetime.date(year, 1, 1)
+    row = 0
+    while day.year == year:
+        index[day.month, day.day] = row
+        row += 1
+        day += datetime.timedelta(days=1)
+    return index
+
+
+def _calendar(times):
+    """Month, day and minute of day of times.
+
+    Args:
+        times (list or ndarray): of datetime or datetime64.
+
+    Returns:
+        (tuple) arrays of int.
+    """
+    seconds = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+    days = (seconds // 86400).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    month = months.astype(np.int64) % 12 + 1
+    day = (days.astype(np.int64) -
+           months.astype('datetime64[D]').astype(np.int64) + 1)
+    minute = seconds % 86400 // 60
+    return month, day, minute
+
+
+def _year(year):
+    """View of load history of each day of year.
+
+    Returns:
+        (ndarray)
+
+    Raises:
+        KeyError: if a day of year is not in the history.
+    """
+    if year not in _YEARS:
+        data, first = _load()
+        start = datetime.date(year, 1, 1).toordinal() - first
+        stop = datetime.date(year + 1, 1, 1).toordinal() - first
+        if start < 0 or stop > len(data) or np.isnan(data[start:stop]).any():
+            raise KeyError('Load history does not cover every day of %s' %
+                           year)
+        _YEARS[year] = data[start:stop]
+    return _YEARS[year]
+
+
+def _row(weather, dt):
+    """Row of weather at time.
+
+    Raises:
+        KeyError: if dt is not in weather.
+    """
+    row = weather.index(dt)
+    if row is None:
+        raise KeyError('%s is not in weather' % dt)
+    return row
 
 
 class Load(Device):
@@ -54,17 +181,25 @@ class Load(Device):
         """Returns: (object): bid for energy"""
         e = self.needsenergy()
         if e:
-            return Bid(id(self), e, self.buy_kwh())
+            return Bid(self.handle, e, self.buy_kwh())
         else:
             return None
 
+    def standing_bid(self):
+        """Returns: (Bid) bid at the value of energy for any need."""
+        return Bid(self.handle, 0., self.buy_kwh())
+
     def needsenergy(self):
         """Returns: (float): energy need"""
-        key = env.time
-        if key not in self.balance:
-            dmnd = self.demand(key)
-            self.balance[key] = dmnd
-        return self.balance[key]
+        step = self.context.step
+        need = self.balance[step]
+        if need != need:
+            # demand has not been calculated for this step, demands are Wh
+            # of an hour
+            need = self.demand(self.context.time) * self.context.timestep
+            self.balance[step] = need
+            self.dmnd[step] = need
+        return need
 
     def power_io(self, energy):
         """Energy transfer.
@@ -75,19 +210,28 @@ class Load(Device):
         Returns: i
             (float): energy still needed.
         """
-        key = env.time
-        self.balance[key] += energy
-        return self.balance[key]
+        step = self.context.step
+        self.balance[step] += energy
+        return self.balance[step]
 
     def buy_kwh(self):
         """Returns: (float) value of kwh."""
         return self.value_kwh()
 
+    def demand_series(self, times):
+        """Demand of a run of steps.
+
+        Args:
+            times (list): datetime of each step.
+
+        Returns:
+            (ndarray) Wh of an hour at each time.
+        """
+        return np.array([self.demand(dt) for dt in times], dtype=float)
+
     def enabled(self):
         """Returns: (float) total energy load has actually used."""
-        td = self.total() * env.total_time/self.interval
-        sf = sum(self.balance.values())
-        return abs(td - sf)
+        return abs(self.dmnd.sum() - self.balance.sum())
 
     def value_kwh(self):
         return self.per_kwh
@@ -109,8 +253,12 @@ class Annual(Load):
     Attributes:
         mult (float): scaling factor
         year (int): year
+        data (ndarray): half hourly load of each day of year, shared by
+            every Annual load of the year.
     """
 
+    inputs = ('data',)
+
     def __init__(self, mult=71.4, year=2013):
         """Initialize.
 
@@ -125,10 +273,11 @@ class Annual(Load):
         self.droop_ratio = 0.
         self.year = year
         self.per_kwh = 0.07
-        self.data = _load()
-        self.small_id = SMALL_ID.next(type(self))
-        self.balance = {}
-        self.dmnd = {}
+        self.data = _year(year)
+        self.days = _day_index(year)
+        self.small_id = self.context.ids.next(type(self))
+        self.balance = Series()
+        self.dmnd = Series()
         self.detail = None
         self.interval = 365*24.
 
@@ -149,14 +298,35 @@ class Annual(Load):
             (float) Wh
 
         """
-        mdt = datetime.date(self.year, dt.month, dt.day)
-        offset = int(round(dt.hour*2.0))
-        dmnd = -self.data[mdt][offset]*self.mult/40812.5
-        self.dmnd[env.time] = dmnd
-        return dmnd
+        day = self.days[dt.month, dt.day]
+        if day < 0:
+            raise ValueError('%s is not a day of %s' % (dt, self.year))
+        offset = dt.hour*2 + dt.minute//30  # half hour of day
+        return -self.data[day, offset]*self.mult/40812.5
 
     __call__ = demand
 
+    def demand_series(self, times):
+        """Demand of a run of steps, indexed by day of year.
+
+        >>> BD = Annual(100.)
+        >>> times = [datetime.datetime(2014, 12, 16, 20),
+        ...          datetime.datetime(2014, 1, 16, 3)]
+        >>> [round(i, 1) for i in BD.demand_series(times)]
+        [-11.7, -7.2]
+
+        Args:
+            times (list or ndarray): of datetime or datetime64.
+
+        Returns:
+            (ndarray) Wh of an hour at each time.
+        """
+        month, day, minute = _calendar(times)
+        rows = self.days[month, day]
+        if (rows < 0).any():
+            raise ValueError('Times are not days of %s' % self.year)
+        return -self.data[rows, minute//30]*self.mult/40812.5
+
     def total(self):
         """Total load for year.
 
@@ -169,7 +339,11 @@ class Annual(Load):
             (float) Wh
 
         """
-        return sum(self(hour_to_dt(i)) for i in range(365*24))
+        data = self.data
+        if len(data) == 366:
+            data = np.delete(data, 59, axis=0)  # hours of 2013 skip Feb 29
+        # demand at the start of each hour
+        return float(-data[:, ::2].sum()*self.mult/40812.5)
 
     def __repr__(self):
         if not self.detail:
@@ -198,22 +372,40 @@ class FanLoad(Load):
         self.thermostat = thermostat
         self.per_kwh = 0.075
         self.droop_ratio = 0.
-        self.dmnd = {}
-        self.balance = {}
+        self.dmnd = Series()
+        self.balance = Series()
         self.interval = 24*265.
 
     def demand(self, key):
-        """Demand returns (float) Wn energy demand for (key)."""
-        if key not in self.dmnd:
-            if float(env.weather[key]["Dry-bulb (C)"]) > self.thermostat:
-                self.dmnd[key] = self.wattage
-            else:
-                self.dmnd[key] = 0.
-
-        return self.dmnd[key]
+        """Demand returns (float) Wn energy demand for (key).
+
+        >>> from weather import WeatherStore
+        >>> store = WeatherStore.from_records(
+        ...     [{'datetime': datetime.datetime(2013, 1, 1, h),
+        ...       'Dry-bulb (C)': 25 + 2*h} for h in range(3)])
+        >>> fan = FanLoad(10)
+        >>> fan.context = env.SimulationContext(store)
+        >>> fan(datetime.datetime(2013, 1, 1, 2))
+        -10
+        >>> fan(datetime.datetime(2013, 1, 2))
+        Traceback (most recent call last):
+            ...
+        KeyError: '2013-01-02 00:00:00 is not in weather'
+        """
+        weather = self.context.weather
+        if weather["Dry-bulb (C)"][_row(weather, key)] > self.thermostat:
+            return self.wattage
+        return 0.
+
+    def demand_series(self, times):
+        """Demand of a run of steps from weather columns."""
+        weather = self.context.weather
+        rows = weather.rows(times)
+        return np.where(weather["Dry-bulb (C)"][rows] > self.thermostat,
+                        float(self.wattage), 0.)
 
     def total(self):
-        return sum(self.dmnd.values())
+        return self.dmnd.sum()
 
     __call__ = demand
 
@@ -242,25 +434,30 @@ class LightingLoad(Load):
         self.wattage = - abs(wattage) # ensure negative
         self.lux = lux
         self.per_kwh = 0.075
-        self.dmnd = {}
+        self.dmnd = Series()
         self.droop_ratio = 0.
         self.hour = hour
-        self.balance = {}
+        self.balance = Series()
         self.interval = 24*265.
 
     def demand(self, key):
         """Demand returns (float) Wh energy demand for (key)."""
-        if key not in self.dmnd:
-            if float(env.weather[key]["DFIL (lux)"]) < self.lux and \
-                    env.time.hour > self.hour:
-                self.dmnd[key] = self.wattage
-            else:
-                self.dmnd[key] = 0.
-
-        return self.dmnd[key]
+        weather = self.context.weather
+        if weather["DFIL (lux)"][_row(weather, key)] < self.lux and \
+                key.hour > self.hour:
+            return self.wattage
+        return 0.
+
+    def demand_series(self, times):
+        """Demand of a run of steps from weather columns."""
+        weather = self.context.weather
+        rows = weather.rows(times)
+        hour = _calendar(times)[2]//60
+        on = (weather["DFIL (lux)"][rows] < self.lux) & (hour > self.hour)
+        return np.where(on, float(self.wattage), 0.)
 
     def total(self):
-        return sum(self.dmnd.values())
+        return self.dmnd.sum()
 
     __call__ = demand
 
@@ -268,6 +465,49 @@ class LightingLoad(Load):
         return '%s W Lighting Load' % self.wattage
 
 
+class Profile(object):
+
+    """Interpolated profile of a day that can be pickled."""
+
+    def __init__(self, hours, loads, kind='cubic'):
+        """Initialize.
+
+        Args:
+            hours (list): of times (float) in hours.
+            loads (list): of total loads at hour (float) Wh.
+            kind  (str): interpolation method default (cubic).
+        """
+        from scipy.interpolate import interp1d
+        self.points = (hours, loads, kind)
+        self.interpolate = interp1d(hours, loads, kind=kind)
+        self.table = None
+
+    def __call__(self, hour):
+        return self.interpolate(hour)
+
+    def minutes(self):
+        """Profile at each minute of a day, tabulated once.
+
+        Returns:
+            (ndarray) NaN at minutes outside of the profile.
+        """
+        if self.table is None:
+            hours = np.arange(24*60)/60.
+            inside = (hours >= np.min(self.points[0])) & \
+                (hours <= np.max(self.points[0]))
+            table = np.empty(len(hours))
+            table.fill(np.nan)
+            table[inside] = self.interpolate(hours[inside])
+            self.table = table
+        return self.table
+
+    def __getstate__(self):
+        return self.points
+
+    def __setstate__(self, points):
+        self.__init__(*points)
+
+
 class DailyLoad(Load):
 
     """Spline interpolated Load Profile.
@@ -276,6 +516,8 @@ class DailyLoad(Load):
         per_kwh (float): value of energy.
     """
 
+    inputs = ('profile',)
+
     def __init__(self, hours, loads, kind='cubic', name=''):
         """Initilize.
 
@@ -287,28 +529,36 @@ class DailyLoad(Load):
             kind  (str): interpolation method default (cubic).
             name (str):
         """
-        self.profile = interp1d(hours, loads, kind=kind)
+        self.profile = Profile(hours, loads, kind)
         self.name = name
         self.classification = "load"
         self.deferable = False
         self.droop_ratio = 0.
         self.per_kwh = 0.07
-        self.small_id = SMALL_ID.next(name)
-        self.balance = {}
-        self.dmnd = {}
+        self.small_id = self.context.ids.next(name)
+        self.balance = Series()
+        self.dmnd = Series()
         self.interval = 24.
 
     def demand(self, key):
         """Return (float) energy demand Wh for (datetime)."""
-
-        if key not in self.dmnd:
-            dmnd = self.profile(key.hour + key.minute/60.)
-            self.dmnd[key] = float(dmnd)
-
-        return self.dmnd[key]
+        value = self.profile.minutes().item(key.hour*60 + key.minute)
+        if value != value:
+            raise ValueError('%s is outside of profile' % key)
+        return value
+
+    def demand_series(self, times):
+        """Demand of a run of steps from the table of the profile."""
+        values = self.profile.minutes()[_calendar(times)[2]]
+        if np.isnan(values).any():
+            raise ValueError('Times are outside of profile')
+        return values
 
     def total(self):
-        return sum([self(hour_to_dt(i)) for i in range(24)])
+        hourly = self.profile.minutes()[::60]
+        if np.isnan(hourly).any():
+            raise ValueError('Hours of day are outside of profile')
+        return float(hourly.sum())
 
     __call__ = demand
 
@@ -316,8 +566,177 @@ class DailyLoad(Load):
         return "%s %s, %s Wh Daily" % (self.name, self.small_id,
                                        round(self.total(), 1))
 
+
+class AggregateLoad(Load):
+
+    """Many instances of a load bidding as one device.
+
+    Every instance demands what the load demands, shifted by its start
+    offset.  The coincident fraction of instances start on time, the rest
+    start at random up to spread hours early or late.  Instances with the
+    same offset are calculated together.  With weather, the demand of all
+    instances at every weather row is tabulated once, so a step costs a
+    lookup whatever the number of instances, offsets and steps.
+
+    Offsets are whole multiples of resolution minutes, the load must have a
+    demand at every shifted time.  The resolution follows the step of the
+    weather of the context by default, e.g. 60 minutes for hourly weather.
+    Shifted times outside the weather wrap around it, so instances at the
+    ends of a year follow the other end.
+
+    >>> from weather import WeatherStore
+    >>> start = datetime.datetime(2013, 1, 1)
+    >>> store = WeatherStore.from_records(
+    ...     [{'datetime': start + datetime.timedelta(hours=h),
+    ...       'Dry-bulb (C)': '30'} for h in range(8760)])
+    >>> with env.SimulationContext(store):
+    ...     fans = AggregateLoad(FanLoad(10), 10, coincidence=.3)
+    ...     ends = [start, datetime.datetime(2013, 12, 31, 23)]
+    ...     fans.demand_series(ends).tolist()
+    [-100.0, -100.0]
+
+    Attributes:
+        load (Load): demand of an instance, following the context of the
+            aggregate.
+        n (int): instances.
+        offsets (ndarray): distinct start offsets in minutes.
+        counts (ndarray): instances at each offset.
+    """
+
+    def __init__(self, load, n, coincidence=1., spread=1., resolution=None,
+                 seed=0):
+        """Initialize.
+
+        Args:
+            load (Load): load of one instance, copied.
+            n (int): instances.
+            coincidence (float): fraction of instances that start on time.
+            spread (float): hours other instances start early or late.
+            resolution (int): minutes offsets are rounded to (default step
+                of weather of context, or 1 without weather).
+            seed (int): seed of offsets.
+        """
+        self.load = copy.copy(load)
+        self.load.__dict__.pop('_context', None)
+        if resolution is None:
+            weather = self.context.weather
+            resolution = 1 if weather is None else \
+                max(int(round(weather.step()*60)), 1)
+        self.n = n
+        self.coincidence = coincidence
+        self.spread = spread
+        shifted = n - int(round(n*coincidence))
+        random_state = np.random.RandomState(seed)
+        steps = np.round(random_state.uniform(-spread, spread, shifted) *
+                         60./resolution)
+        minutes = np.append(np.zeros(n - shifted, dtype=int),
+                            steps.astype(int)*resolution)
+        self.offsets, self.counts = np.unique(minutes, return_counts=True)
+        self.classification = "load"
+        self.droop_ratio = load.droopable()
+        self.per_kwh = load.value_kwh()
+        self.balance = Series()
+        self.dmnd = Series()
+        self.interval = getattr(load, 'interval', 24.)
+
+    def _set_context(self, context):
+        self._context = context
+        self.load.context = context
+
+    context = property(Load._get_context, _set_context,
+                       doc='SimulationContext of aggregate and its load.')
+
+    def _shifted(self, times):
+        """Demand of one instance at each offset.
+
+        Returns:
+            (ndarray) Wh of an hour, a row of times for each offset.
+        """
+        stamps = np.asarray(times, dtype='datetime64[s]')
+        weather = self.context.weather
+        rows = []
+        for m in self.offsets.tolist():
+            shifted = stamps - np.timedelta64(int(m), 'm')
+            if weather is not None:
+                shifted = weather.wrap(shifted)
+            try:
+                rows.append(self.load.demand_series(shifted.astype(object)))
+            except KeyError:
+                raise KeyError('Times shifted by %s minutes are not in '
+                               'weather, offsets need a resolution of '
+                               'weather steps' % m)
+        return np.array(rows).reshape(len(self.offsets), len(stamps))
+
+    def _table(self):
+        """Demand of all instances at each row of weather, tabulated once.
+
+        Returns:
+            (ndarray) Wh of an hour, or None without weather.
+        """
+        weather = self.context.weather
+        if weather is None:
+            return None
+        table = self.__dict__.get('_weather_table')
+        if table is None or table[0] is not weather:
+            demand = self.counts.dot(self._shifted(weather.datetimes()))
+            table = self._weather_table = (weather, demand)
+        return table[1]
+
+    def demand(self, key):
+        """Return (float) energy demand Wh of all instances for (datetime)."""
+        table = self._table()
+        if table is not None:
+            row = self.context.weather.index(key)
+            if row is not None:
+                return table.item(row)
+        return float(self.counts.dot(self._shifted([key])[:, 0]))
+
+    def demand_series(self, times):
+        """Demand of all instances over a run of steps."""
+        table = self._table()
+        if table is not None:
+            try:
+                return table[self.context.weather.rows(times)]
+            except KeyError:
+                pass  # times between rows of weather
+        return self.counts.dot(self._shifted(times))
+
+    __call__ = demand
+
+    def instances(self):
+        """Statistics of each instance over every step.
+
+        The demand and energy served of each step are shared by instances in
+        proportion to their demand.
+
+        Returns:
+            (dict) arrays of offset (minutes), demand (Wh) and enabled (Wh)
+            of each instance.
+
+        Raises:
+            IndexError: if only a window of steps is retained.
+        """
+        times = whole(self.context.time_series)
+        steps = len(times)
+        dmnd = np.nan_to_num(self.dmnd.values(0, steps))
+        served = np.nan_to_num(self.balance.values(0, steps)) - dmnd
+        shifted = self._shifted(times)
+        total = self.counts.dot(shifted)
+        share = np.divide(shifted, total, out=np.zeros_like(shifted),
+                          where=total != 0)
+        index = np.repeat(np.arange(len(self.offsets)), self.counts)
+        return {'offset': self.offsets[index],
+                'demand': share.dot(dmnd)[index],
+                'enabled': share.dot(served)[index]}
+
+    def total(self):
+        return self.dmnd.sum()
+
+    def __repr__(self):
+        return '%s x %s' % (self.n, self.load)
+
+
 times = np.array(range(0, 49))/2.
-spline_profile = DailyLoad(times, np.array(LOAD_PROFILE)*17)
 
 
 def tv(wattage=20):
@@ -338,20 +757,96 @@ def tv(wattage=20):
     tv_inst.per_kwh = .09
     return tv_inst
 
-TV = tv(20)
 
-FLAT = DailyLoad([0, 25], [8.15, 8.15], kind='linear', name='Flat')
+def _bd_ave():
+    """Average Load Profile from 2013 Annual."""
+    bd = bd_example()
+    # demand at the start of each hour, summed over days
+    hourly = -bd.data[:, ::2].sum(axis=0)*bd.mult/40812.5
+    # End of day is the same as beginning
+    hourly = np.append(hourly, hourly[0])
+    return DailyLoad(range(len(hourly)), hourly/365., name='Mean Daily')
+
+
+_BUILDERS = {
+    'spline_profile': lambda: DailyLoad(times, np.array(LOAD_PROFILE)*17),
+    'TV': lambda: tv(20),
+    'FLAT': lambda: DailyLoad([0, 25], [8.15, 8.15], kind='linear',
+                              name='Flat'),
+    'BD': Annual,
+    'BD_AVE': _bd_ave}
+_EXAMPLES = {}
+
+
+def _example(name):
+    """Example load, built on first use."""
+    if name not in _EXAMPLES:
+        _EXAMPLES[name] = _BUILDERS[name]()
+    return _EXAMPLES[name]
+
+
+def spline_example():
+    """Daily load of LOAD_PROFILE."""
+    return _example('spline_profile')
+
+
+def tv_example():
+    """20 W TV."""
+    return _example('TV')
+
 
-# Average Load Profile from 2013 Annual
-BD_AVE = [0.]*24
-BD = Annual()
-for i in range(24*365):
-    dt = hour_to_dt(i)
-    BD_AVE[dt.hour] += BD(dt)
+def flat_example():
+    """Flat daily load."""
+    return _example('FLAT')
+
+
+def bd_example():
+    """Annual load of the Bangladesh history."""
+    return _example('BD')
+
+
+def bd_ave():
+    """Mean daily load of the Bangladesh history."""
+    return _example('BD_AVE')
+
+
+class _Example(object):
+
+    """Stand in for an example load, which is built when first used.
+
+    Attributes are read and set on the load, calls are passed to it, and
+    pickles hold the load itself.
+    """
 
-BD_AVE.append(BD_AVE[0])  # End of day is the same as beginning
-BD_AVE = DailyLoad(range(len(BD_AVE)), np.array(BD_AVE)/365.,
-                   name='Mean Daily')
+    __slots__ = ('_name',)
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, name):
+        return getattr(_example(self._name), name)
+
+    def __setattr__(self, name, value):
+        setattr(_example(self._name), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return _example(self._name)(*args, **kwargs)
+
+    def __reduce__(self):
+        return _example, (self._name,)
+
+    def __repr__(self):
+        return repr(_example(self._name))
+
+    def __str__(self):
+        return str(_example(self._name))
+
+
+spline_profile = _Example('spline_profile')
+TV = _Example('TV')
+FLAT = _Example('FLAT')
+BD = _Example('BD')
+BD_AVE = _Example('BD_AVE')
 
 
 def noisy_profile(t):
@@ -359,6 +854,46 @@ def noisy_profile(t):
     return spline_profile(t)*(.9+random.random()/5.)
 
 
+def ensemble(load, times, n, spread=.1, correlation=.9, seed=0, hours=1.):
+    """Realizations of the demand of a load under uncertainty.
+
+    Each realization scales the demand of every step by 1 + spread*x, where
+    x is standard normal noise correlated from step to step, an AR(1)
+    process with correlation between steps an hour apart.  Multipliers are
+    not negative.  Realization i is drawn from its own stream seeded by
+    (seed, i), so it is the same in ensembles of any size.
+
+    Args:
+        load (Load): load with demand_series, such as DailyLoad or Annual.
+        times (list): datetime of each step.
+        n (int): realizations.
+        spread (float): standard deviation of multipliers.
+        correlation (float): correlation of noise an hour apart.
+        seed (int): seed of ensemble.
+        hours (float or array_like): hours per step, or of each step.
+
+    Returns:
+        (ndarray) Wh of an hour, a row of steps for each realization.
+    """
+    steps = len(times)
+    step_hours = np.empty(steps)
+    step_hours[:] = hours
+    x = np.empty((n, steps))
+    for i in range(n):
+        x[i] = np.random.RandomState([seed, i]).standard_normal(steps)
+    rho = correlation ** step_hours
+    scale = np.sqrt(1. - rho*rho)
+    if steps > 1 and (rho == rho[0]).all():
+        from scipy.signal import lfilter
+        x[:, 1:] *= scale[0]
+        x = lfilter([1.], [1., -rho[0]], x, axis=1)
+    else:
+        for k in range(1, steps):
+            x[:, k] = rho[k]*x[:, k-1] + scale[k]*x[:, k]
+    multipliers = np.maximum(1. + spread*x, 0.)
+    return load.demand_series(times) * multipliers
+
+
 def quantify_load(load, solar_gen):
     """How much of a load can be met by sunlight?
 
@@ -101,13 +101,19 @@ class STEEPMerit(object):
         depletion expense, Im is manufacturing environment impact, Ip is
         environment impact from prospective system use, and r is a weighted
         performance based penalty.  In this case I is (kg CO2 eq) and r
-        is (Wh * domain_r).
+        is (Wh * domain_r).  Domains without generation area have infinite
+        impact per area.
         """
+        impact = domain.co2() + domain.parameter('emissions')*self.life
+        area = domain.area()
+        if area:
+            impact = impact / area
+        else:
+            impact = float('inf') if impact else float('nan')
         total = (domain.cost() +
                  domain.depletion()*self.life +
                  (domain.surplus() + domain.parameter('losses')) * self.life/1000. +
-                 (domain.co2() +
-                 domain.parameter('emissions')*self.life ) / domain.area() -
+                 impact -
                  domain.rvalue())
 
         logging.debug('merit %s', total)
@@ -25,17 +25,43 @@ def fsify(s):
     s = s.replace('.', '_')
     return s.lower()
 
-def heatmap(list_like):
-    mangled_a = []
-    for i in range(0, len(list_like), 24):
-        mangled_a.append(list_like[i:i+23])
-    data = np.array(mangled_a)
+def heatmap(list_like, width=24):
+    """Arrange steps as an image of days.
+
+    Args:
+        list_like (list): value of each step.
+        width (int): steps per day (default hourly steps).
+
+    Returns:
+        (ndarray) a column of each day.
+    """
+    if len(list_like) % width == 0:
+        data = np.asarray(list_like).reshape(-1, width)[:, :width-1]
+    else:
+        mangled_a = []
+        for i in range(0, len(list_like), width):
+            mangled_a.append(list_like[i:i+width-1])
+        data = np.array(mangled_a)
     # data = np.flipud(data)
     data = np.rot90(data, 3)
     data = np.fliplr(data)
     return data
 
 
+def daily_means(list_like, width=24):
+    """Mean of each day of steps.
+
+    Args:
+        list_like (list): value of each step.
+        width (int): steps per day (default hourly steps).
+
+    Returns:
+        (list)
+    """
+    return [np.mean(list_like[i:i+width-1])
+            for i in range(0, len(list_like), width)]
+
+
 def module_temp(irradiance, weather_data):
     # todo: Maybe Sandia Module Temperature instead?
     """Module Temperature Calculation
@@ -46,15 +72,19 @@ def module_temp(irradiance, weather_data):
         - 1.528 \cdot WindSpeed + 4.3
 
     Args:
-        irradiance (float): W/m^2
-        weather_data (dict): wind speed in m/s, ambient temp in C
+        irradiance (float or ndarray): W/m^2
+        weather_data (dict): wind speed in m/s, ambient temp in C, either
+            values or arrays such as the columns of a WeatherStore.
 
     Returns:
-        (float): temperature
+        (float or ndarray): temperature
     """
 
-    t_amb = float(weather_data["Dry-bulb (C)"])
-    wind_ms = float(weather_data['Wspd (m/s)'])
+    t_amb = weather_data["Dry-bulb (C)"]
+    wind_ms = weather_data['Wspd (m/s)']
+    if np.ndim(t_amb) == 0:
+        t_amb = float(t_amb)
+        wind_ms = float(wind_ms)
     t_module = .945*t_amb + .028*irradiance - 1.528*wind_ms + 4.3
     return t_module
 
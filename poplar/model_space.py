@@ -1,72 +1,69 @@
-from caelum import eere
-from loads import annual
-from devices import Domain, SimplePV, PVSystem
-from storage import IdealStorage
-from controllers import MPPTChargeController, SimpleChargeController
+"""Model space of storage capacity and PV size.
 
-import matplotlib.pyplot as plt
+Merit components of every sizing of a Solar Home System are calculated in a
+single sweep.
+"""
+import numpy as np
+import environment as env
+from loads import Annual
+from devices import Gateway
+from sources import SimplePV, Site, InclinedPlane
+from storage import IdealStorage
+from controllers import MPPTChargeController
+from weather import epw
+from engine import sweep
 
 import sys
 sys.stdout.flush()
 
+PLACE = (24.811468, 89.334329)
+CAPACITIES = range(20, 250, 10)
+RATINGS = range(5, 200, 5)
+NAMES = ['cost', 'depletion', 'co2', 'emissions', 'area', 'losses',
+         'surplus', 'throughput', 'shortfall', 'lolh', 'outages']
 
-def model(z):
-    size, pv = z
-    pv = max(pv, 0)
-    size = max(size, 0)
-    PLACE = (24.811468, 89.334329)
-    SHS = Domain([annual(),
-                  PVSystem([MPPTChargeController([SimplePV(pv)])],
-                            PLACE, 24.81, 180.),
-                  IdealStorage(size)])
-    for i in eere.EPWdata('418830'):
-        SHS(i)
-    return SHS
 
+def model(weather):
+    """System to size.
 
-def system_merit(domains):
-    """calulate merit for various parameters"""
-    a = 0
-    t = 0
-    c = 0
-    p = 0
-    r = 0
-    g = 0
-    l = 0
-    G = 0
-    C = 0
-    nl = 0  # net load
-    eg = 0
-    o = 0
-    for domain in domains:
-        G += domain.STC()
-        g += sum(domain.g)
-        g += domain.parameter('losses')
-        a += domain.parameter('area')
-        C += domain.capacity()
-        eg += domain.surplus
-        nl += sum(domain.net_l)
-        l += sum(domain.l)
-        t += domain.tox()
-        c += domain.co2()
-        p += domain.cost()
-        o += domain.outages
-        r += domain.rvalue()
+    Args:
+        weather (WeatherStore)
 
-    I = t*c/a/G
-    R = r/G
-    P = p/G
-    eta = round(nl/g * 100, 1)
-    nt = nl*P*I*R/g
-    return ', '.join([str(i) for i in [G, C, eta, P, I, R, t, a, c, r, o, g,
-                                       eg, l, nl, nt]])
+    Returns:
+        (Gateway)
+    """
+    context = env.SimulationContext(weather)
+    with context:
+        plane = InclinedPlane(Site(PLACE), 24.81, 180.)
+        return Gateway([Annual(),
+                        MPPTChargeController([SimplePV(100., plane)]),
+                        IdealStorage(100.)], context=context)
 
 
-if __name__ == '__main__':
-    plt.ion()
-    plt.show()
-    print 'G,C,eta,P,I,Rg,t,a,c,r,o,g,eg,l,nl,nt'
+def system_merit(result):
+    """calulate merit for various parameters
+
+    Args:
+        result (Sweep)
 
-    for i in range(20, 250, 10):
-        for j in range(5, 200, 5):
-            print system_merit([model([i, j])])
+    Returns:
+        (list) csv lines of merit components of each sizing.
+    """
+    merit = result.merit()
+    lines = []
+    for i, capacity in enumerate(result.capacities):
+        for j, rating in enumerate(result.ratings):
+            values = [capacity, rating, merit[i, j]]
+            values += [result[name][i, j] for name in NAMES]
+            lines.append(', '.join([str(v) for v in values]))
+    return lines
+
+
+if __name__ == '__main__':
+    weather = epw('418830')
+    result = sweep(model(weather), CAPACITIES, RATINGS, weather.datetimes())
+    print ', '.join(['C', 'G', 'merit'] + NAMES)
+    for line in system_merit(result):
+        print line
+    best = result.best()
+    print best, np.nanmin(result.merit())
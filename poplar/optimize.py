@@ -12,7 +12,8 @@ from devices import Gateway
 from sources import SimplePV, Site, InclinedPlane
 from storage import IdealStorage
 from controllers import MPPTChargeController, SimpleChargeController
-from caelum import eere
+from weather import epw
+from engine import run
 import numpy as np
 from scipy import optimize
 
@@ -44,6 +45,7 @@ class Case(object):
         self.tilt = 24.81  # array tilted at latitude
         self.azimuth = 180.  # array pointed due south
         self.weather_station = '418830'
+        self.weather = epw(self.weather_station)
         self.foo = open('log.csv', 'w')
 
     def model(self, parameters):
@@ -55,21 +57,21 @@ class Case(object):
         Returns:
             (domain): results from model.
         """
-        env.reset()
         size, pv = parameters
         # don't go below 1 negative/division by zero issues
         pv = max(pv, 1.)
         size = max(size, 1.)
 
-        plane = InclinedPlane(Site(self.place), self.tilt, self.azimuth)
-        load = self.load()
-        SHS = Gateway([load,
-                      self.cc([SimplePV(pv, plane)]),
-                      IdealStorage(size)])
+        # each evaluation has its own context so evaluations can run in
+        # threads, weather is shared.
+        with env.SimulationContext(self.weather) as context:
+            plane = InclinedPlane(Site(self.place), self.tilt, self.azimuth)
+            load = self.load()
+            SHS = Gateway([load,
+                          self.cc([SimplePV(pv, plane)]),
+                          IdealStorage(size)], context=context)
 
-        for r in eere.EPWdata('418830'):
-            env.update_time(r['datetime'])
-            SHS()
+        run(SHS, self.weather.datetimes())
 
         print SHS.details()
         self.foo.write('%s,%s,%s\n' % (size, pv, SHS.merit()))
@@ -133,6 +135,5 @@ def simple(load, merit):
 if __name__ == '__main__':
     import loads
     import merit
-    env.set_weather(eere.EPWdata('418830'))
     steep = merit.STEEPMerit()
     mppt(loads.Annual, steep)
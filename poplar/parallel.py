@@ -0,0 +1,308 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Parallel simulation of isolated island domains.
+
+A sub-domain is isolated when no energy can cross its Gateway.  The Gateway
+does not export, so storage does not offer through it, and is an island, so
+sources inside do not offer beyond it, and no source outside can offer into
+it, every source is closed in by an island that does not enclose it.
+
+Isolated domains only share the clock with the rest of the system.  They are
+detached once and kept by worker processes for the whole run, a batch of
+domains per process, while the rest of the system is simulated in this
+process.  The weather is sent to each worker once.  Each domain settles its
+bids in the same order, against the same offers, as it does when the whole
+system is calculated at once, so results are identical to a serial run.
+Results are merged back into the devices of the system after every window
+of steps.
+
+Only isolated domains are parallel.  Domains that import from the rest of
+the system, households of doc/case2a importing from the PV of their parent
+among them, are coupled with it by the order of bids within every step and
+are simulated serially with it, so parallel.run does not speed them up.
+
+"""
+import copy
+import multiprocessing
+import cPickle as pickle
+from cStringIO import StringIO
+
+import engine
+from devices import Model, Gateway
+from sources import Source
+from storage import IdealStorage
+
+# attributes of the structure of a network, not merged back
+STRUCTURE = ('network', 'handle', '_context', '_rollup_cache', '_children',
+             '_revision')
+
+
+def isolated(gateway):
+    """Isolated sub-domains of a system.
+
+    Domains within an isolated domain are simulated with it and are not
+    listed.
+
+    Args:
+        gateway (Gateway): top gateway of system.
+
+    Returns:
+        (list) Gateways, in network order.
+    """
+    graph = gateway.routes()
+    registry = graph['registry']
+    parents = graph['parents']
+    gateways = graph['gateways']
+
+    # nearest enclosing island of every source
+    closed = set()
+    for node in registry:
+        if not hasattr(node, 'offer') or isinstance(node, IdealStorage):
+            continue
+        if not isinstance(node, Source):
+            return []  # offers of unknown reach
+        g = gateways[node.handle]
+        while g is not None and not registry[g].island():
+            parent = parents[g]
+            g = None if parent is None else gateways[parent]
+        if g is None:
+            return []  # offers to every domain
+        closed.add(g)
+
+    found = []
+    member = [False] * len(registry)
+    for node in registry[1:]:
+        h = node.handle
+        member[h] = member[parents[h]]
+        if member[h] or type(node) is not Gateway or node.export() \
+                or not node.island():
+            continue
+        a = parents[h]
+        while a is not None and a not in closed:
+            a = parents[a]
+        if a is not None:
+            continue  # a source outside offers into domain
+        tree = _tree(node)
+        inside = set(id(i) for i in tree)
+        if any(id(n) not in inside for i in tree[1:]
+               for n in gateway.network.neighbors(i)):
+            continue  # devices shared with the rest of the system
+        member[h] = True
+        found.append(node)
+    return found
+
+
+def _tree(node):
+    """Devices below node, breadth first in the order of registry."""
+    tree = [node]
+    seen = set([id(node)])
+    for i in tree:
+        for child in getattr(i, 'children', None) or []:
+            if id(child) not in seen:
+                seen.add(id(child))
+                tree.append(child)
+    return tree
+
+
+def _rebuild(gateway, devices, order):
+    """Build network of gateway again, keeping the order of devices."""
+    for node in devices:
+        node.__dict__.pop('network', None)
+    network = gateway.graph()
+    network.graph['root'] = gateway
+    network.graph['nodes'] = [node for node in order if node in network]
+
+
+def _detach(gateway, domains):
+    """Remove domains from system.
+
+    Returns:
+        (tuple) devices and order of system, and the parent, position and
+        domain of each domain removed.
+    """
+    devices = list(gateway.network)
+    order = list(gateway.nodes())
+    removed = []
+    for domain in domains:
+        parent = gateway.find_node(gateway.routes()['parents'][domain.handle])
+        removed.append((parent, parent.children.index(domain), domain))
+    for parent, index, domain in removed:
+        parent.children = [i for i in parent.children if i is not domain]
+    _rebuild(gateway, devices, order)
+    return devices, order, removed
+
+
+def _attach(gateway, detached):
+    """Return domains removed by _detach to system."""
+    devices, order, removed = detached
+    for parent, index, domain in reversed(removed):
+        children = list(parent.children)
+        children.insert(index, domain)
+        parent.children = children
+    _rebuild(gateway, devices, order)
+
+
+def _results(domains):
+    """Pickled state of domains, without structure, inputs or weather."""
+    shared = {}
+    for domain in domains:
+        for node in domain.network:
+            shared[id(node.network)] = 'network'
+            for name in node.inputs:
+                shared[id(getattr(node, name))] = name
+            shared[id(node.context)] = 'clock'
+    buf = StringIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: shared.get(id(obj))
+    pickler.dump(domains)
+    return buf.getvalue()
+
+
+def _serve(conn, weather):
+    """Simulate a batch of domains kept in a worker process.
+
+    The first message holds the pickled domains, their network orders and
+    clock, later messages the times and hours of a window, answered with
+    the pickled domains.  None stops the worker.
+
+    Args:
+        conn (Connection): pipe to the parent process.
+        weather (WeatherStore): weather of clock, sent once per worker.
+    """
+    unpickler = pickle.Unpickler(StringIO(conn.recv()))
+    unpickler.persistent_load = lambda key: weather if key == 'weather' \
+        else None
+    domains, orders, clock = unpickler.load()
+    for domain, order in zip(domains, orders):
+        devices = _tree(domain)
+        _rebuild(domain, devices, order)
+        local = copy.copy(clock)
+        local.time_series = []
+        for node in devices:
+            node.context = local
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        times, hours = message
+        for domain in domains:
+            calculated = domain.hours  # only the top gateway counts its calls
+            engine.run(domain, times, hours)
+            domain.hours = calculated
+        conn.send(_results(domains))
+    conn.close()
+
+
+def _holds_devices(value):
+    if isinstance(value, Model):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(isinstance(i, Model) for i in value)
+    return False
+
+
+def _merge(domain, twin):
+    """Copy state of simulated twin into devices of domain."""
+    for node, simulated in zip(_tree(domain), _tree(twin)):
+        skip = set(STRUCTURE) | set(node.inputs)
+        for name, value in vars(simulated).items():
+            if name not in skip and not _holds_devices(value):
+                node.__dict__[name] = value
+
+
+class _Worker(object):
+
+    """Worker process keeping a batch of domains between windows."""
+
+    def __init__(self, batch, order, context):
+        """Start worker and send it the domains of batch.
+
+        Args:
+            batch (list): detached domains.
+            order (list): network order of system.
+            context (SimulationContext): clock of system.
+        """
+        self.batch = batch
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(child, context.weather))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        orders = []
+        for domain in batch:
+            inside = set(id(i) for i in _tree(domain))
+            orders.append([i for i in order if id(i) in inside])
+        clock = copy.copy(context)
+        clock.time_series = []
+        keys = {id(context): 'context', id(context.weather): 'weather'}
+        buf = StringIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: keys.get(id(obj))
+        pickler.dump((batch, orders, clock))
+        self.conn.send(buf.getvalue())
+
+    def start(self, times, hours):
+        """Start simulating a window of steps."""
+        self.conn.send((times, hours))
+
+    def merge(self):
+        """Wait for the window and merge results into the batch."""
+        unpickler = pickle.Unpickler(StringIO(self.conn.recv()))
+        unpickler.persistent_load = lambda key: None
+        for domain, twin in zip(self.batch, unpickler.load()):
+            _merge(domain, twin)
+
+    def stop(self):
+        self.conn.send(None)
+        self.conn.close()
+        self.process.join()
+
+
+def run(gateway, times, hours=1., processes=None, window=None):
+    """Simulate gateway over times, isolated domains in parallel.
+
+    Only domains listed by isolated run in worker processes, the rest of
+    the system runs in this process, so systems of domains that import from
+    their parent, as doc/case2a, are not sped up.  Systems without isolated
+    domains are simulated by engine.run.
+
+    Isolated domains are detached once and kept by the workers for the
+    whole run, the weather is sent to each worker once.  After every window
+    of steps results are merged back into the devices of the system.
+
+    Args:
+        gateway (Gateway): top gateway of system.
+        times (list): datetime of each step.
+        hours (float or array_like): hours per step, or of each step.
+        processes (int): worker processes (default number of CPUs).
+        window (int): steps simulated between merges (default all steps).
+    """
+    domains = isolated(gateway)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if not domains or processes < 2 or not len(times):
+        engine.run(gateway, times, hours)
+        return
+    step_hours = engine.step_lengths(hours, len(times))
+    batches = [domains[i::processes] for i in range(processes)]
+    batches = [batch for batch in batches if batch]
+    window = window or len(times)
+    order = gateway.nodes()
+    detached = _detach(gateway, domains)
+    workers = []
+    try:
+        for batch in batches:
+            workers.append(_Worker(batch, order, gateway.context))
+        for start in range(0, len(times), window):
+            stop = start + window
+            for worker in workers:
+                worker.start(times[start:stop], step_hours[start:stop])
+            engine.run(gateway, times[start:stop], step_hours[start:stop])
+            for worker in workers:
+                worker.merge()
+    finally:
+        for worker in workers:
+            worker.stop()
+        _attach(gateway, detached)
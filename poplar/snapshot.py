@@ -0,0 +1,140 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Snapshots of simulation state.
+
+A Snapshot freezes a running system at the current step: the state of every
+device in the network, gateway ledgers and counters, and the simulation
+clock.  Restoring a snapshot builds an independent copy of the system bound
+to its own copy of the clock, so several alternatives can be forked from one
+warm started prefix and simulated from there.
+
+Read only inputs, the weather of the context and device attributes named in
+inputs such as load profiles, are referenced by the snapshot rather than
+copied, and records only keep the steps calculated, so snapshots are small
+and quick to restore.  A snapshot can be pickled to send it to another
+process, its inputs are then sent with it once.
+
+Forks can be changed before they are simulated, e.g. to compare dispatch at
+other prices.  A battery left with 8 Wh serves the load of highest value.
+
+>>> import datetime
+>>> import environment as env
+>>> from devices import Gateway
+>>> from loads import DailyLoad
+>>> from storage import IdealStorage
+>>> ctx = env.SimulationContext()
+>>> lamp = DailyLoad([0, 25], [-8, -8], kind='linear', name='Lamp')
+>>> fan = DailyLoad([0, 25], [-8, -8], kind='linear', name='Fan')
+>>> lamp.per_kwh, fan.per_kwh = .2, .1
+>>> system = Gateway([lamp, fan, IdealStorage(24)], context=ctx)
+>>> ctx.update_time(datetime.datetime(2013, 1, 1, 0))
+>>> system.calc()
+>>> same, dearer_fan = snapshot(system).fork(2)
+>>> dearer_fan.children[1].per_kwh = .3
+>>> for fork in same, dearer_fan:
+...     fork.context.update_time(datetime.datetime(2013, 1, 1, 1))
+...     fork.calc()
+...     print [load.balance[1] for load in fork.children[:2]]
+[0.0, -8.0]
+[-8.0, 0.0]
+
+"""
+import cPickle as pickle
+from cStringIO import StringIO
+
+
+def inputs(gateway):
+    """Read only inputs of a network.
+
+    Args:
+        gateway (Gateway): any device of the network.
+
+    Returns:
+        (list) weather of contexts and inputs of devices.
+    """
+    found = []
+    seen = set()
+    for node in gateway.network:
+        values = [getattr(node, name) for name in node.inputs]
+        values.append(node.context.weather)
+        for value in values:
+            if value is not None and id(value) not in seen:
+                seen.add(id(value))
+                found.append(value)
+    return found
+
+
+class Snapshot(object):
+
+    """Frozen state of a system and its clock.
+
+    Attributes:
+        step (int): step of clock when taken.
+        time (datetime): time of clock when taken.
+        state (str): pickled state.
+        shared (list): read only inputs referenced by state.
+    """
+
+    def __init__(self, gateway):
+        """Take snapshot.
+
+        Args:
+            gateway (Gateway): top gateway of system.
+        """
+        gateway.nodes()  # copies settle market ties in the same order
+        context = gateway.context
+        self.step = context.step
+        self.time = context.time
+        self.shared = inputs(gateway)
+        keys = dict((id(value), str(i)) for i, value in enumerate(self.shared))
+        buf = StringIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: keys.get(id(obj))
+        bound = '_context' in gateway.__dict__
+        pickler.dump((gateway, context, bound))
+        self.state = buf.getvalue()
+
+    def restore(self):
+        """Copy of system as it was when the snapshot was taken.
+
+        Returns:
+            (Gateway) top gateway, bound to a copy of the clock.
+        """
+        unpickler = pickle.Unpickler(StringIO(self.state))
+        unpickler.persistent_load = lambda key: self.shared[int(key)]
+        gateway, context, bound = unpickler.load()
+        # bidders are ranked again in case values of the copy are changed
+        gateway.network.graph.pop('bids', None)
+        if not bound:
+            gateway.bind(context)
+        return gateway
+
+    def fork(self, n):
+        """Independent copies of system.
+
+        Args:
+            n (int): copies.
+
+        Returns:
+            (list) top gateways.
+        """
+        return [self.restore() for _ in range(n)]
+
+    def __len__(self):
+        return len(self.state)
+
+    def __repr__(self):
+        return 'Snapshot at step %s, %s bytes' % (self.step, len(self.state))
+
+
+def snapshot(gateway):
+    """Snapshot of system.
+
+    Args:
+        gateway (Gateway): top gateway of system.
+
+    Returns:
+        (Snapshot)
+    """
+    return Snapshot(gateway)
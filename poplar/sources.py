@@ -1,17 +1,20 @@
-import environment as env
 import logging
+import numpy as np
 from devices import Device, Model
 from solpy import irradiation
+import irradiance
 from misc import significant, module_temp
 from econ import Offer
+from ledger import Series
 
 logger = logging.getLogger(__name__)
 
 class Source(Device):
-    def offer(self, dest_id):
+    def offer(self, dest):
+        # energy does not leave islands
         e = self.hasenergy()
-        if e:
-            return Offer(id(self), e, self.sell_kwh())
+        if e and self.reaches(dest):
+            return Offer(self.handle, e, self.sell_kwh())
         else:
             return None
 
@@ -20,11 +23,14 @@ class Source(Device):
         return 1.0
 
     def energy(self):
-        if not env.time in self.balance:
-            output = self.output()
-            self.balance[env.time] = output
-            self.generation[env.time] = output
-        return self.balance[env.time]
+        step = self.context.step
+        energy = self.balance[step]
+        if energy != energy:
+            # output has not been calculated for this step, output is W
+            energy = self.output() * self.context.timestep
+            self.balance[step] = energy
+            self.generation[step] = energy
+        return energy
 
 
     def sell_kwh(self):
@@ -51,15 +57,15 @@ class Source(Device):
         return 0.
 
     def power_io(self, energy):
-        key = env.time
-        if abs(energy) > self.balance[key]:
+        step = self.context.step
+        if abs(energy) > self.balance[step]:
             raise Exception('PV over commited')
-        self.balance[key] += energy
-        self.debits[key] = self.debits.setdefault(key, 0) + energy
+        self.balance[step] += energy
+        self.debits[step] += energy
         return 0.
 
     def total_gen(self):
-        return sum(self.generation.values())
+        return self.generation.sum()
         #return sum(self.balance.values()) - sum(self.debits.values()) + self.losses()
 
 class SimplePV(Device):
@@ -169,9 +175,28 @@ class SimplePV(Device):
         Returns:
             vmp, imp: (tuple) of voltage and current.
         """
-        key = env.time
         irr = self.irr_object()
-        t_cell = module_temp(irr, env.weather[key])
+        t_cell = module_temp(irr, self.context.record())
+
+        vmp = self.vmp + (t_cell - 25.) * self.tc_vmp
+
+        return vmp, self.imp * irr / 1000.
+
+    def output_series(self, weather, start=None, irr=None):
+        """Temperature compensated module output of a run of steps.
+
+        Args:
+            weather (WeatherStore): weather of each step.
+            start (int): first step, None if steps are not simulated.
+            irr (ndarray): irradiation of each step (default irradiation of
+                irr_object).
+
+        Returns:
+            vmp, imp: (tuple) of voltage and current arrays.
+        """
+        if irr is None:
+            irr = self.irr_object.energy_series(weather, start)
+        t_cell = module_temp(irr, weather)
 
         vmp = self.vmp + (t_cell - 25.) * self.tc_vmp
 
@@ -217,7 +242,7 @@ class Site(Model):
         self.shading = None
 
     def output(self):
-        return env.weather[env.time]
+        return self.context.record()
 
     __call__ = output
 
@@ -231,27 +256,33 @@ class InclinedPlane(Device):
 
     """
 
+    Irradiation of every weather row is calculated once for each site,
+    orientation and weather and shared by every plane, see irradiance.poa.
+
     Attributes:
         tilt: (float) degrees array tilt.
         azimuth: (float) degrees array azimuth.
+        model: (str) transposition model.
         solar_resource: (object)
 
     """
 
-    def __init__(self, site, tilt, azimuth):
+    def __init__(self, site, tilt, azimuth, model='p9'):
         """Should have at least one child.
 
         Args:
             weather: (object)
             tilt: (float) degrees array tilt.
             azimuth: (float) degrees array azimuth.
+            model: (str) transposition model (default p9).
 
         """
         self.site = site
         self.tilt = tilt
         self.azimuth = azimuth
+        self.model = model
         self.children = [self.site]
-        self.irr = {}
+        self.irr = Series()
 
     def energy(self):
         """Calculate total energy for a time period.
@@ -260,19 +291,59 @@ class InclinedPlane(Device):
             key (dict value):
         """
 
-        try:
-            key = env.time
-            if not key in self.irr:
-                irr = irradiation.irradiation(self.site(),
-                                              self.site.place,
-                                              t=self.tilt,
-                                              array_azimuth=self.azimuth,
-                                              model='p9')
-                self.irr[key] = irr
-            return self.irr[key]
-        except Exception as e:
-            print(e)
-            return 0
+        context = self.context
+        step = context.step
+        irr = self.irr[step]
+        if irr != irr:
+            if context.row is None:
+                logger.warning('No weather at %s', context.time)
+                return 0
+            irr = self.poa(context.weather).item(context.row)
+            self.irr[step] = irr
+        return irr
+
+    def irradiation(self, record):
+        """Irradiation of plane for a weather record."""
+        return irradiation.irradiation(record, self.site.place, t=self.tilt,
+                                       array_azimuth=self.azimuth,
+                                       model=self.model)
+
+    def poa(self, weather):
+        """Irradiation of plane at every row of weather.
+
+        Args:
+            weather (WeatherStore)
+
+        Returns:
+            (ndarray) irradiation of each row.
+        """
+        rows = None
+        if weather.origin is not None:
+            weather, rows = weather.origin
+        values = irradiance.poa(self.site.place, self.tilt, self.azimuth,
+                                weather, self.model)
+        return values if rows is None else values[rows]
+
+    def energy_series(self, weather, start=None):
+        """Energy of a run of steps.
+
+        Steps that have already been calculated are not calculated again.
+
+        Args:
+            weather (WeatherStore): weather of each step.
+            start (int): first step, None if steps are not simulated and
+                should not be recorded.
+
+        Returns:
+            (ndarray) irradiation of each step.
+        """
+        irr = self.poa(weather)
+        if start is None:
+            return irr
+        recorded = self.irr.values(start, start + len(irr))
+        irr = np.where(recorded == recorded, recorded, irr)
+        self.irr.put(start, irr)
+        return irr
 
     __call__ = energy
 
@@ -2,12 +2,12 @@
 #
 # This program is free software. See terms in LICENSE file.
 import numpy as np
-import environment as env
 from misc import significant
 from visuals import report as stor_rep
 
 from devices import Device, Gateway
 from econ import Bid, Offer
+from ledger import Series, whole
 
 
 class FLA(object):
@@ -64,27 +64,32 @@ class IdealStorage(Device):
         self.full_hours = 0.
         self.shortfall = 0.
         self.state_series = []
-        self.state_dict = {}
+        self.step_soc = Series()
         self.hours = []
         self.timeseries = []  # todo: not currently used, needed for interp?
         self.loss_occurence = 0
         self.c_in = []
         self.c_out = []
         self.buy = 0.00001
-        self.network = self.graph()
 
     def report(self):
         return stor_rep(self, str(self))
 
     def soc_log(self):
-        last = 1.0
-        t = []
-        for i in env.time_series:
-            if i in self.state_dict:
-                s = self.state_dict[i]
-                last = s
-            t.append(last)
-        return t
+        """State of charge of every step.
+
+        Steps without energy transfers hold the last state, starting full.
+
+        Returns:
+            (list)
+        """
+        steps = self.context.step + 1
+        soc = np.empty(steps + 1)
+        soc[0] = 1.0
+        soc[1:] = self.step_soc.values(0, steps)
+        recorded = np.where(soc == soc, np.arange(steps + 1), 0)
+        np.maximum.accumulate(recorded, out=recorded)
+        return soc[recorded][1:].tolist()
 
     def tox(self):
         return self.weight()*self.chem.tox_kg
@@ -119,9 +124,12 @@ class IdealStorage(Device):
 
     capacity_availible = needsenergy
 
-    def offer(self, dest_id):
+    def offer(self, dest_handle):
         """Energy offer.
 
+        Args:
+            dest_handle (int): registry handle of device bidding.
+
         Returns:
             (Offer)
 
@@ -129,15 +137,16 @@ class IdealStorage(Device):
         # if domain export = false don't offer outside domain
         # todo: this needs some more nuance
         # todo: this should possiblty be a domain method.
-        if dest_id == id(self):
+        if dest_handle == self.handle:
             return None
 
-        dest = self.find_node(dest_id)
-        # print self.dest_gateway(dest_id)
+        dest = self.find_node(dest_handle)
+        # print self.dest_gateway(dest_handle)
         # print self.network.nodes()
-        # print self.src_gateway(dest_id)
+        # print self.src_gateway(dest_handle)
 
-        if self.src_gateway(dest_id) is not self.dest_gateway(dest_id):
+        if self.src_gateway(dest_handle) is not \
+                self.dest_gateway(dest_handle):
             for step in self.path(dest):
                 if type(step) is Gateway:
                     if not step.export():
@@ -145,19 +154,19 @@ class IdealStorage(Device):
 
         v = self.hasenergy()
         if v:
-            o = Offer(id(self), v, self.sell_kwh())
-            o.storage = True
-            return o
+            return Offer(self.handle, v, self.sell_kwh(), storage=True)
 
     def bid(self):
         e = self.needsenergy()
         if e:
-            b = Bid(id(self), e, self.buy_kwh())
-            b.storage = True
-            return b
+            return Bid(self.handle, e, self.buy_kwh(), storage=True)
         else:
             return None
 
+    def standing_bid(self):
+        """Returns: (Bid) bid at the value of storing energy for any need."""
+        return Bid(self.handle, 0., self.buy_kwh(), storage=True)
+
     def droopable(self):
         return 1.
 
@@ -186,7 +195,7 @@ class IdealStorage(Device):
     def emissions(self):
         return self.throughput/1000.*self.chem.co2_kwh
 
-    def power_io(self, power, hours=1.):
+    def power_io(self, power, hours=None):
         """Power input/output
 
         >>> s = IdealStorage(100)
@@ -196,20 +205,30 @@ class IdealStorage(Device):
         >>> - 10 + s
         0.0
 
+        >>> s.power_io(-40., .25)
+        0.0
+        >>> s.soc()
+        0.8
+
         Args:
-            power: (float) watts positive charging, negative discharging.
-            hours: (float) time delta (default 1 hour).
+            power: (float) watts positive charging, negative discharging, or
+                watt hours of the current step if hours is None.
+            hours: (float) time delta (default time step of context).
 
         Returns:
             energy: (float) watt hours constrained, +/- full/discharged.
 
             """
-        energy = power*hours
+        if hours is None:
+            hours = self.context.timestep
+            energy = float(power)
+        else:
+            energy = power*hours
         self.hours.append(hours)
 
         if energy > 0:
             # Track C rate
-            self.c_in.append(energy/self.nominal_capacity)
+            self.c_in.append(energy/hours/self.nominal_capacity)
             max_in = self.nominal_capacity - self.state
             e_delta = min(energy, max_in)
             self.state += e_delta
@@ -223,7 +242,7 @@ class IdealStorage(Device):
 
         if energy < 0:
             # Track C rate
-            self.c_out.append(energy/self.nominal_capacity)
+            self.c_out.append(energy/hours/self.nominal_capacity)
             max_out = self.state
             e_delta = - min(-energy, max_out)
             self.state += e_delta
@@ -244,7 +263,8 @@ class IdealStorage(Device):
             e_delta = 0
         t_soc = self.soc()
         self.state_series.append(t_soc)
-        self.state_dict[env.time] = t_soc
+        if self.context.step >= 0:  # clock started
+            self.step_soc[self.context.step] = t_soc
         return e_delta - energy
 
     def autonomy(self):
@@ -255,7 +275,7 @@ class IdealStorage(Device):
         rate looks like the reciprocal.
 
         """
-        median_c = np.median(self.c_out)
+        median_c = np.median(whole(self.c_out))
         return abs(1.0/median_c)
 
     def __radd__(self, x):
@@ -265,7 +285,7 @@ class IdealStorage(Device):
         return self.state/self.nominal_capacity
 
     def details(self):
-        soc_series = np.array(self.state_series)
+        soc_series = np.array(whole(self.state_series))
         results = {
             'Storage shortfall (wh)': significant(self.shortfall),  # ENS
             'Storage surplus (wh)': significant(self.surplus),
@@ -0,0 +1,136 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Streaming simulation.
+
+A Stream steps a system through weather and yields a record of every step
+as it is calculated, so results of long runs can be consumed, written out or
+stopped early without waiting for the whole run.
+
+By default every device keeps the history of the whole run.  With
+history=False each device retains only a window of recent steps, histories
+kept as lists become bounded deques and the Stream keeps running aggregates
+instead: shortfall, loss of load hours and outages of the top gateway,
+storage throughput and statistics of the state of charge.  Memory then stays
+constant however many steps are simulated.  Metrics of the whole run, such
+as details and reports, raise IndexError once steps are no longer retained
+rather than report on the window alone.
+
+"""
+import collections
+import datetime
+
+from ledger import Series, Ledger, RunningStats
+from storage import IdealStorage
+
+# list attributes that grow by a value per step or per transaction
+HISTORIES = ('hours', 'state_series', 'c_in', 'c_out', 'timeseries',
+             'time_series', 'g', 'l', 'd', 'net_g', 'net_l')
+
+StepRecord = collections.namedtuple('StepRecord', [
+    'step', 'time', 'demand', 'source', 'credits', 'debits', 'balance',
+    'outage'])
+
+
+def retain(gateway, window=24):
+    """Hold only the last window steps of every record of a network.
+
+    Args:
+        gateway (Gateway): any device of the network.
+        window (int): steps retained.
+    """
+    objects = list(gateway.network)
+    contexts = [node.context for node in objects]
+    for obj in objects + contexts:
+        for name, value in vars(obj).items():
+            if isinstance(value, (Series, Ledger)):
+                if value.window is None:
+                    value.retain(window)
+            elif name in HISTORIES and isinstance(value, list):
+                setattr(obj, name,
+                        collections.deque(value[-window:], maxlen=window))
+
+
+class Stream(object):
+
+    """Step a system through weather.
+
+    Attributes:
+        gateway (Gateway): top gateway of system.
+        weather (iterable): weather records or datetimes of steps.
+        hours (float): hours per step.
+        soc (dict): RunningStats of state of charge at the end of each step,
+            by storage.
+    """
+
+    def __init__(self, gateway, weather, hours=1., history=True, window=24):
+        """Initialize.
+
+        Args:
+            gateway (Gateway): top gateway of system.
+            weather (iterable): weather records or datetimes of steps, read
+                as the stream is iterated.
+            hours (float): hours per step.
+            history (bool): keep records of every step, otherwise only a
+                window of steps and running aggregates.
+            window (int): steps retained without history.
+        """
+        self.gateway = gateway
+        self.weather = weather
+        self.hours = hours
+        self.history = history
+        storages = [node for node in gateway.network
+                    if isinstance(node, IdealStorage)]
+        self.soc = dict((storage, RunningStats()) for storage in storages)
+        if not history:
+            retain(gateway, window)
+
+    def __iter__(self):
+        gateway = self.gateway
+        context = gateway.context
+        for record in self.weather:
+            if isinstance(record, datetime.datetime):
+                time = record
+            else:
+                time = record['datetime']
+            context.update_time(time, self.hours)
+            gateway(self.hours)
+            for storage, stats in self.soc.items():
+                stats.add(storage.soc())
+            step = context.step
+            yield StepRecord(step, time, gateway.demand[step],
+                             gateway.source[step], gateway.credits[step],
+                             gateway.debits[step], gateway.balance[step],
+                             gateway.outage[step])
+
+    def run(self):
+        """Step through all weather.
+
+        Returns:
+            (dict) summary.
+        """
+        for _ in self:
+            pass
+        return self.summary()
+
+    def summary(self):
+        """Running aggregates of steps calculated.
+
+        Returns:
+            (dict) shortfall (Wh), lolh (hours), outages, throughput (Wh) and
+            mean, minimum and maximum state of charge of all storage.
+        """
+        stats = self.soc.values()
+        count = sum(s.count for s in stats)
+        return {
+            'shortfall': self.gateway.shortfall,
+            'lolh': self.gateway.lolh,
+            'outages': self.gateway.outage.sum(),
+            'throughput': sum(s.throughput for s in self.soc),
+            'soc mean': (sum(s.mean * s.count for s in stats) / count
+                         if count else float('nan')),
+            'soc min': min([s.minimum for s in stats] or [float('nan')]),
+            'soc max': max([s.maximum for s in stats] or [float('nan')])}
+
+    def __repr__(self):
+        return 'Stream of %s' % self.gateway
@@ -6,7 +6,7 @@ import scipy.stats as stats
 import numpy as np
 import networkx as nx
 import os
-from misc import heatmap, latexify, fsify
+from misc import heatmap, daily_means, latexify, fsify
 
 
 def table_dict(d):
@@ -69,6 +69,7 @@ def report(device, figname='SHS', title=None):
     soc_frequency.set_ylabel('Hourly Frequency')
     soc_frequency.set_title('Normalized SoC Histogram')
     soc_log = domain.soc_log()
+    width = domain.context.steps_per_day()
     pp = np.array(soc_log)
     pp.sort()
     fit = stats.norm.pdf(pp, np.mean(pp), np.std(pp))
@@ -80,7 +81,7 @@ def report(device, figname='SHS', title=None):
     storage_soc.set_xlabel('day')
     storage_soc.set_ylabel('hour')
     storage_soc.set_title('Storage State of Charge')
-    soc = storage_soc.imshow(heatmap(soc_log), aspect='auto')
+    soc = storage_soc.imshow(heatmap(soc_log, width), aspect='auto')
     soc_bar = fig.colorbar(soc)
     soc_bar.set_label('%')
 
@@ -88,7 +89,7 @@ def report(device, figname='SHS', title=None):
     d_soc_frequency.set_xlabel('SoC')
     d_soc_frequency.set_ylabel('Daily Frequency')
     d_soc_frequency.set_title('Normalized SoC Histogram')
-    d_pp = [np.mean(soc_log[i:i+23]) for i in range(0, 365*24, 24)]
+    d_pp = daily_means(soc_log, width)
     d_pp.sort()
     fit2 = stats.norm.pdf(d_pp, np.mean(d_pp), np.std(d_pp))
 
@@ -162,12 +163,13 @@ def batt_report(device):
     basename = fsify(latexify(str(device)))
 
     soc_log = device.soc_log()
+    width = device.context.steps_per_day()
 
     freq_pdf(soc_log, 'Hourly SoC frequency %s' % str(device), 'hourly_soc_freq_%s' % basename)
 
-    heat_pdf(heatmap(soc_log), '%s Soc' % str(device), 'soc_%s' % basename)
+    heat_pdf(heatmap(soc_log, width), '%s Soc' % str(device), 'soc_%s' % basename)
 
-    freq_pdf([np.mean(soc_log[i:i+23]) for i in range(0, 365*24, 24)],
+    freq_pdf(daily_means(soc_log, width),
              'Daily SoC frequency %s' % str(device),
              'daily_soc_freq_%s' % basename)
 
@@ -196,9 +198,10 @@ def multi_pdfs(domain):
     """
 
     basename = fsify(str(domain))
+    width = domain.context.steps_per_day()
 
     for i in ['credits','debits','demand','source','balance']:
-        heat_pdf(heatmap(domain.log_dict_to_list(i)), '%s %s' %(str(domain), i), '%s_%s' % (i, basename))
+        heat_pdf(heatmap(domain.log_values(i), width), '%s %s' %(str(domain), i), '%s_%s' % (i, basename))
 
     print(dict_to_latex_table(domain.details(), str(domain), basename))
 
@@ -216,11 +219,12 @@ def multi_report(domain, figname='SHS', title=None):
         title = figname
     fig = plt.figure(figsize=(8.5, 11))
     td = domain.details()
+    width = domain.context.steps_per_day()
     s_constraint = fig.add_subplot(321)
     s_constraint.set_xlabel('day')
     s_constraint.set_ylabel('hour')
     s_constraint.set_title('Domain Credits')
-    bc = s_constraint.imshow(heatmap(domain.log_dict_to_list('credits')), aspect='auto')
+    bc = s_constraint.imshow(heatmap(domain.log_values('credits'), width), aspect='auto')
     b4 = fig.colorbar(bc)
     b4.set_label('Wh')
 
@@ -228,7 +232,7 @@ def multi_report(domain, figname='SHS', title=None):
     storage_soc.set_xlabel('day')
     storage_soc.set_ylabel('hour')
     storage_soc.set_title('Domain Debits')
-    soc = storage_soc.imshow(heatmap(domain.log_dict_to_list('debits')), aspect='auto')
+    soc = storage_soc.imshow(heatmap(domain.log_values('debits'), width), aspect='auto')
     soc_bar = fig.colorbar(soc)
     soc_bar.set_label('%')
 
@@ -236,7 +240,7 @@ def multi_report(domain, figname='SHS', title=None):
     demand_profile.set_xlabel('day')
     demand_profile.set_ylabel('hour')
     demand_profile.set_title('Demand Profile')
-    dp = demand_profile.imshow(heatmap(domain.log_dict_to_list('demand')), aspect='auto')
+    dp = demand_profile.imshow(heatmap(domain.log_values('demand'), width), aspect='auto')
     dp_bar = fig.colorbar(dp)
     dp_bar.set_label('Wh')
 
@@ -244,7 +248,7 @@ def multi_report(domain, figname='SHS', title=None):
     generator_o.set_xlabel('day')
     generator_o.set_ylabel('hour')
     generator_o.set_title('Source Output')
-    gp = generator_o.imshow(heatmap(domain.log_dict_to_list('source')), aspect='auto')
+    gp = generator_o.imshow(heatmap(domain.log_values('source'), width), aspect='auto')
     gp_bar = fig.colorbar(gp)
     gp_bar.set_label('Wh')
 
@@ -252,7 +256,7 @@ def multi_report(domain, figname='SHS', title=None):
     s_constraint.set_xlabel('day')
     s_constraint.set_ylabel('hour')
     s_constraint.set_title('Domain Balance')
-    bc = s_constraint.imshow(heatmap(domain.log_dict_to_list('balance')), aspect='auto')
+    bc = s_constraint.imshow(heatmap(domain.log_values('balance'), width), aspect='auto')
     # cmap = plt.cm.Greys_r)
     b4 = fig.colorbar(bc)
     b4.set_label('Wh')
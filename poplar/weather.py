@@ -0,0 +1,327 @@
+# Copyright (C) 2015 Nathan Charles
+#
+# This program is free software. See terms in LICENSE file.
+"""Columnar weather data.
+
+Weather records are parsed once into typed NumPy columns indexed by hour of
+simulation.  EPW years are cached as binary files that are memory-mapped on
+later runs, so loading a year does not parse any text.
+
+>>> import datetime
+>>> store = WeatherStore.from_records(
+...     [{'datetime': datetime.datetime(2013, 1, 1, h),
+...       'Dry-bulb (C)': '2%s' % h, 'DS': '?9'} for h in range(3)])
+>>> len(store), store.fields
+(3, ('Dry-bulb (C)', 'datetime'))
+>>> store['Dry-bulb (C)'][2]
+22.0
+>>> store.index(datetime.datetime(2013, 1, 1, 1))
+1
+>>> store[1]['datetime']
+datetime.datetime(2013, 1, 1, 1, 0)
+
+Stores can be resampled to steps shorter than an hour.
+
+>>> quarters = store.resample(.25)
+>>> len(quarters), quarters['Dry-bulb (C)'][1]
+(12, 20.25)
+>>> quarters.index(datetime.datetime(2013, 1, 1, 2, 45))
+11
+
+"""
+import hashlib
+import os
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get('POPLAR_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.poplar'))
+DATETIME_FIELDS = ('datetime', 'utc_datetime')
+CACHE_VERSION = 1
+
+
+class WeatherRecord(object):
+
+    """Read only view of a row of a WeatherStore.
+
+    Behaves like the weather record dicts of caelum.
+    """
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, name):
+        value = self.store.columns[name][self.row]
+        if name in DATETIME_FIELDS:
+            return value.item()
+        return float(value)
+
+    def get(self, name, default=None):
+        if name in self.store.columns:
+            return self[name]
+        return default
+
+    def keys(self):
+        return list(self.store.fields)
+
+    def __contains__(self, name):
+        return name in self.store.columns
+
+    def __repr__(self):
+        return 'WeatherRecord %s' % self.row
+
+
+class WeatherStore(object):
+
+    """Typed weather columns.
+
+    Numeric fields are stored as float64, datetime fields as datetime64[s].
+    Text fields such as EPW data source flags are dropped.
+
+    Attributes:
+        data (ndarray): structured array, possibly memory-mapped.
+        fields (tuple): field names.
+        columns (dict): column arrays keyed by field name.
+        origin (tuple): store and rows this store was taken from, or None.
+    """
+
+    def __init__(self, data, origin=None):
+        """Initialize.
+
+        Args:
+            data (ndarray): structured array of weather data.
+            origin (tuple): store and rows data was taken from.
+        """
+        self.data = data
+        self.fields = data.dtype.names
+        self.columns = dict((name, data[name]) for name in self.fields)
+        self.origin = origin
+        self._datetimes = None
+        self._index = None
+        self._fingerprint = None
+
+    @classmethod
+    def from_records(cls, iterable):
+        """Parse weather records.
+
+        Args:
+            iterable: of dicts, e.g. caelum.eere.EPWdata.
+
+        Returns:
+            (WeatherStore)
+        """
+        raw = {}
+        n = 0
+        for record in iterable:
+            for name, value in record.items():
+                raw.setdefault(name, []).append(value)
+            n += 1
+        columns = []
+        for name in sorted(raw):
+            values = raw[name]
+            if len(values) != n:
+                logger.warning('Dropping incomplete weather field %s', name)
+                continue
+            if name in DATETIME_FIELDS:
+                columns.append((name, np.array(values, dtype='datetime64[s]')))
+                continue
+            try:
+                columns.append((name, np.array(values, dtype=np.float64)))
+            except ValueError:
+                logger.debug('Dropping text weather field %s', name)
+        data = np.empty(n, dtype=[(name, c.dtype) for name, c in columns])
+        for name, column in columns:
+            data[name] = column
+        return cls(data)
+
+    @classmethod
+    def load(cls, filename, mmap_mode='r'):
+        """Load a store saved with save, memory-mapped by default."""
+        return cls(np.load(filename, mmap_mode=mmap_mode))
+
+    def save(self, filename):
+        """Save store as a binary .npy file."""
+        path = os.path.dirname(filename)
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+        # write then rename so other processes never map a partial file
+        temp = '%s.%s.tmp' % (filename, os.getpid())
+        with open(temp, 'wb') as f:
+            np.save(f, np.asarray(self.data))
+        os.rename(temp, filename)
+
+    def datetimes(self):
+        """Returns: (list) datetime of each row."""
+        if self._datetimes is None:
+            self._datetimes = self.columns['datetime'].astype(object).tolist()
+        return self._datetimes
+
+    def index(self, dt):
+        """Row of datetime.
+
+        Args:
+            dt (datetime)
+
+        Returns:
+            (int) row or None if dt is not in store.
+        """
+        if self._index is None:
+            self._index = dict((t, i) for i, t in enumerate(self.datetimes()))
+        return self._index.get(dt)
+
+    def rows(self, times):
+        """Rows of datetimes.
+
+        Args:
+            times (list or ndarray): of datetime or datetime64.
+
+        Returns:
+            (ndarray) of int.
+        """
+        times = np.asarray(times, dtype='datetime64[s]')
+        column = self.columns['datetime']
+        rows = np.searchsorted(column, times).clip(0, max(len(self) - 1, 0))
+        if len(self) and (column[rows] == times).all():
+            return rows
+        # unsorted weather or missing times
+        rows = [self.index(dt) for dt in times.astype(object).tolist()]
+        if None in rows:
+            raise KeyError('Times are not in weather')
+        return np.array(rows, dtype=int)
+
+    def step(self):
+        """Returns: (float) hours between the first two rows, 1 for one row."""
+        if len(self) < 2:
+            return 1.
+        column = self.columns['datetime'].astype('datetime64[s]')
+        return (column[1] - column[0]).astype(np.int64) / 3600.
+
+    def wrap(self, times):
+        """Times wrapped around the span of the store.
+
+        Times before the first row, or after the step of the last row,
+        continue from the other end, as the weather of a typical year does.
+
+        Args:
+            times (list or ndarray): of datetime or datetime64.
+
+        Returns:
+            (ndarray) of datetime64[s].
+        """
+        times = np.asarray(times, dtype='datetime64[s]')
+        column = self.columns['datetime'].astype('datetime64[s]')
+        first = column.min()
+        if len(self) > 1:
+            step = column[-1] - column[-2]
+        else:
+            step = np.timedelta64(3600, 's')
+        span = (column.max() - first + step).astype(np.int64)
+        seconds = (times - first).astype(np.int64) % span
+        return first + seconds.astype('timedelta64[s]')
+
+    def record(self, row):
+        return WeatherRecord(self, row)
+
+    def resample(self, hours):
+        """Weather at steps of hours.
+
+        Numeric fields are interpolated linearly between rows, steps after
+        the last row hold its values until the next row would start.
+
+        Args:
+            hours (float): hours per step, e.g. .25 for 15 minute steps.
+
+        Returns:
+            (WeatherStore)
+        """
+        times = self.columns['datetime'].astype('datetime64[s]')
+        seconds = (times - times[0]).astype(np.float64)
+        period = seconds[-1] - seconds[-2] if len(self) > 1 else 3600.
+        step = int(round(hours * 3600.))
+        new = np.arange(0, int(seconds[-1] + period), step)
+        data = np.empty(len(new), dtype=self.data.dtype)
+        for name in self.fields:
+            column = self.columns[name]
+            if name in DATETIME_FIELDS:
+                offset = column.astype('datetime64[s]')[0]
+                data[name] = offset + new.astype('timedelta64[s]')
+            else:
+                data[name] = np.interp(new, seconds, column)
+        return WeatherStore(data)
+
+    def take(self, rows):
+        """Weather of rows.
+
+        Args:
+            rows (array_like): of int.
+
+        Returns:
+            (WeatherStore) copy of rows in order, which knows the rows of
+            the original store.
+        """
+        rows = np.asarray(rows, dtype=int)
+        if self.origin is None:
+            origin = (self, rows)
+        else:
+            origin = (self.origin[0], self.origin[1][rows])
+        return WeatherStore(self.data[rows], origin)
+
+    def fingerprint(self):
+        """Returns: (str) digest of data, calculated once."""
+        if self._fingerprint is None:
+            data = np.ascontiguousarray(self.data)
+            digest = hashlib.sha1(repr(data.dtype.descr))
+            digest.update(data.tostring())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return WeatherRecord(self, key)
+        return self.columns[key]
+
+    def __contains__(self, dt):
+        return self.index(dt) is not None
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield WeatherRecord(self, row)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        return (np.asarray(self.data),)  # columns are views of data
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return 'WeatherStore %s rows' % len(self)
+
+
+def epw(station_code, refresh=False):
+    """EPW weather year for a station.
+
+    The year is parsed once with caelum and cached in CACHE_PATH, which can
+    be set with the POPLAR_CACHE environment variable.
+
+    Args:
+        station_code (str): EERE weather station code.
+        refresh (bool): parse the EPW file even if a cache exists.
+
+    Returns:
+        (WeatherStore) memory-mapped weather data.
+    """
+    filename = os.path.join(CACHE_PATH, 'epw_%s_v%s.npy' % (
+        station_code, CACHE_VERSION))
+    if refresh or not os.path.exists(filename):
+        from caelum import eere
+        logger.info('Parsing EPW %s', station_code)
+        WeatherStore.from_records(eere.EPWdata(station_code)).save(filename)
+    return WeatherStore.load(filename)